@@ -0,0 +1,153 @@
+import math
+import time
+import asyncio
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Hashable, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; carries the HTTP status and Retry-After hint"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limiter for LLM-bound work.
+
+    At most `max_concurrency` requests run at once and each key (player) may
+    hold at most `per_key_limit` running or queued slots. Requests beyond the
+    global limit wait in a FIFO queue of at most `max_queue` entries; a request
+    that can't start within `max_wait` seconds is shed instead of piling up.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, per_key_limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.per_key_limit = per_key_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._per_key: Counter = Counter()
+        # Exponentially weighted average of how long an admitted request holds its slot
+        self._service_time = 1.0
+
+        self.admitted = 0
+        self.rejected_per_key = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+
+    def retry_after(self) -> int:
+        waves = (len(self._waiters) + 1) / self.max_concurrency
+        return max(1, math.ceil(self._service_time * waves))
+
+    async def acquire(self, key: Optional[Hashable] = None) -> float:
+        """Wait for a slot; returns the admission time to pass back to release()"""
+        if key is not None:
+            if self._per_key[key] >= self.per_key_limit:
+                self.rejected_per_key += 1
+                raise AdmissionRejected(429, "Too many concurrent requests for this player", self.retry_after())
+            self._per_key[key] += 1
+
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            self._release_key(key)
+            raise
+
+        self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, key: Optional[Hashable] = None, admitted_at: Optional[float] = None):
+        if admitted_at is not None:
+            elapsed = time.perf_counter() - admitted_at
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+        self._release_key(key)
+        self._release_slot()
+
+    def detach(self, key: Optional[Hashable] = None):
+        """
+        Drop the key's claim on a held slot while keeping the slot busy, for work
+        that outlives its request. Whoever takes the work over calls
+        release(None, admitted_at) when it finishes.
+        """
+        self._release_key(key)
+
+    @asynccontextmanager
+    async def admit(self, key: Optional[Hashable] = None):
+        admitted_at = await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key, admitted_at)
+
+    async def _acquire_slot(self):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            raise AdmissionRejected(503, "Server is busy, queue is full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # asyncio.wait doesn't cancel the waiter on timeout, so a slot handed
+            # over at the last moment is never lost
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(waiter)
+            self.shed_deadline += 1
+            raise AdmissionRejected(503, "Server is busy, request timed out in queue", self.retry_after())
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was already handed to us; pass it on
+            self._release_slot()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release_slot(self):
+        # Hand the slot straight to the oldest live waiter, keeping _active unchanged
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def _release_key(self, key: Optional[Hashable]):
+        if key is None:
+            return
+        self._per_key[key] -= 1
+        if self._per_key[key] <= 0:
+            del self._per_key[key]
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queue_depth": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_per_player": self.rejected_per_key,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline,
+            "avg_service_seconds": round(self._service_time, 3)
+        }
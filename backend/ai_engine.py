@@ -5,7 +5,15 @@ import datetime
 from dotenv import load_dotenv
 from minio import Minio
 import re
+import time
+import queue
 import random
+import threading
+import contextvars
+from tracing import span, traced
+from score_cache import SemanticScoreCache, embed
+from token_budget import ledger, attribute, compact_text, ARGUMENT_TOKEN_BUDGET
+import storage
 
 from dotenv import load_dotenv
 import os
@@ -22,12 +30,30 @@ MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+STREAM_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:streamGenerateContent"
 
 # MinIO Configuration
 MINIO_ENDPOINT = "localhost:9000"
 
 BUCKET_NAME = "debate-history"
 
+# Seconds to wait on Gemini before giving up on a call (requests has no default timeout).
+# For streamed responses it also caps the whole stream, not just each read
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+
+# Topics come from a query parameter, so they get a budget of their own
+TOPIC_TOKEN_BUDGET = 60
+
+# Prompt templates are built once at import and kept terse: every character
+# here is paid for on every call
+TOPICS_PROMPT = ("Give exactly 3 controversial, thought-provoking debate topics about {genre}. "
+                 "One per line, each a complete question or statement, no numbering or other text.")
+TOPIC_PROMPT = "Give one interesting, controversial debate topic. Reply with the topic only."
+SCORE_PROMPT = ("Score this debate argument (turn {turn_number}/5), each 0-10.\n"
+                "Topic: {topic}\n"
+                "Argument: {argument}\n"
+                "Reply only:\nLogic: N\nRelevance: N\nPersuasiveness: N")
+
 # Initialize MinIO Client
 MINIO_CLIENT = Minio(
     MINIO_ENDPOINT,
@@ -36,6 +62,9 @@ MINIO_CLIENT = Minio(
     secure=False
 )
 
+# Near-duplicate arguments on the same topic reuse earlier scores
+SCORE_CACHE = SemanticScoreCache(MINIO_CLIENT, BUCKET_NAME)
+
 def create_bucket():
     if not MINIO_CLIENT.bucket_exists(BUCKET_NAME):
         MINIO_CLIENT.make_bucket(BUCKET_NAME)
@@ -54,22 +83,8 @@ def print_full_response(response, label="API Response"):
     print("-------------------\n")
 
 
-def generate_debate_topics_by_genre(genre: str) -> dict:
-    """
-    Generate 3 debate topics for a specific genre using Gemini API
-    """
-    headers = {
-        "Content-Type": "application/json"
-    }
-
-    prompt = f"""
-    Generate exactly 3 interesting and controversial debate topics related to {genre}.
-    The topics should be thought-provoking and suitable for a structured debate.
-    Each topic should be a complete question or statement.
-    Provide only the 3 topics without any additional text or numbering.
-    """
-
-    payload = {
+def _payload(prompt):
+    return {
         "contents": [{
             "parts": [{
                 "text": prompt
@@ -77,12 +92,35 @@ def generate_debate_topics_by_genre(genre: str) -> dict:
         }]
     }
 
+
+def _post_gemini(payload, kind="generate"):
+    """POST a generateContent request to Gemini, tracing it and recording its token usage"""
+    with span("gemini.generate_content", kind=kind) as current:
+        response = requests.post(f"{API_URL}?key={GEMINI_API_KEY}",
+                                 headers={"Content-Type": "application/json"},
+                                 json=payload,
+                                 timeout=GEMINI_TIMEOUT)
+        if current is not None:
+            current.set("status_code", response.status_code)
+        if response.status_code == 200:
+            try:
+                body = response.json()
+                output = body["candidates"][0]["content"]["parts"][0]["text"]
+            except Exception:
+                body, output = {}, ""
+            ledger.record_response(kind, payload["contents"][0]["parts"][0]["text"], output, body.get("usageMetadata"))
+        return response
+
+
+@traced("generate_debate_topics_by_genre")
+def generate_debate_topics_by_genre(genre: str) -> dict:
+    """
+    Generate 3 debate topics for a specific genre using Gemini API
+    """
+    payload = _payload(TOPICS_PROMPT.format(genre=genre))
+
     try:
-        response = requests.post(
-            f"{API_URL}?key={GEMINI_API_KEY}",
-            headers=headers,
-            json=payload
-        )
+        response = _post_gemini(payload, "topics")
 
         if response.status_code == 200:
             content = response.json(
@@ -132,22 +170,10 @@ def generate_debate_topics_by_genre(genre: str) -> dict:
 
 
 def generate_debate_topic():
-    headers = {
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "contents": [{
-            "parts": [{
-                "text": "Generate an interesting and controversial debate topic."
-            }]
-        }]
-    }
+    payload = _payload(TOPIC_PROMPT)
 
     try:
-        response = requests.post(f"{API_URL}?key={GEMINI_API_KEY}",
-                                 headers=headers,
-                                 json=payload)
+        response = _post_gemini(payload, "topic")
         if response.status_code == 200:
             topic = response.json()[
                 "candidates"][0]["content"]["parts"][0]["text"].strip()
@@ -165,88 +191,298 @@ def generate_debate_topic():
     ]
     return random.choice(fallback_topics)
 
-def score_argument_turn(argument, topic, turn_number):
-    headers = {
-        "Content-Type": "application/json"
-    }
+SCORE_CRITERIA = ("logic", "relevance", "persuasiveness")
+DEFAULT_SCORES = {"logic": 5.0, "relevance": 5.0, "persuasiveness": 5.0}
 
-    prompt = f"""
-    Score this debate argument (Turn {turn_number}/5) on:
-    - Logic (0-10)
-    - Relevance to topic (0-10)
-    - Persuasiveness (0-10)
 
-    Topic: {topic}
-    Argument: {argument}
+class ScoreStreamParser:
+    """
+    Incrementally pick "Logic: 8" style scores out of model output.
 
-    Respond with only the numerical scores in this format:
-    Logic: [score]
-    Relevance: [score]
-    Persuasiveness: [score]
+    Text can be fed in arbitrary chunks; a score is only reported once the
+    characters after it show the number is complete, so "1" followed by "0"
+    in the next chunk is read as 10, not 1.
     """
 
-    payload = {
-        "contents": [{
-            "parts": [{
-                "text": prompt
-            }]
-        }]
-    }
+    _pattern = re.compile(r"(logic|relevance|persuasiveness)[^\d\n]*?(\d+(?:\.\d+)?)(?!\d|\.\d)", re.IGNORECASE)
+
+    def __init__(self):
+        self.buffer = ""
+        self.scores = {}
+        self._pos = 0
+
+    def feed(self, text: str, final: bool = False) -> list:
+        """Add text and return the (criterion, score) pairs completed by it"""
+        self.buffer += text
+        found = []
+        for match in self._pattern.finditer(self.buffer, self._pos):
+            # "7" or "7." at the end of the buffer may still grow into "7.5"
+            if not final and self.buffer[match.end():] in ("", "."):
+                break
+            criterion = match.group(1).lower()
+            self._pos = match.end()
+            if criterion in self.scores:
+                continue
+            score = min(max(float(match.group(2)), 0.0), 10.0)
+            self.scores[criterion] = score
+            found.append((criterion, score))
+        return found
+
+    def close(self) -> list:
+        return self.feed("", final=True)
+
+    @property
+    def complete(self) -> bool:
+        return all(criterion in self.scores for criterion in SCORE_CRITERIA)
+
+
+def parse_scores(content: str) -> dict:
+    """Parse a complete scoring response, raising ValueError if a criterion is missing"""
+    parser = ScoreStreamParser()
+    parser.feed(content, final=True)
+    if not parser.complete:
+        raise ValueError(f"Incomplete scores in response: {content!r}")
+    return {criterion: parser.scores[criterion] for criterion in SCORE_CRITERIA}
+
+
+def _score_payload(argument, topic, turn_number):
+    """Build the scoring request; argument and topic must already be compacted"""
+    return _payload(SCORE_PROMPT.format(turn_number=turn_number, topic=topic, argument=argument))
+
+
+@traced("score_argument_turn")
+def score_argument_turn(argument, topic, turn_number, fallback=True):
+    """
+    Score one argument. If Gemini fails, return DEFAULT_SCORES, or raise when
+    fallback is False so the caller can keep a better estimate of its own.
+    """
+    argument = compact_text(argument, ARGUMENT_TOKEN_BUDGET)
+    topic = compact_text(topic, TOPIC_TOKEN_BUDGET)
+    cached = SCORE_CACHE.lookup(topic, argument)
+    if cached is not None:
+        return cached
+
+    payload = _score_payload(argument, topic, turn_number)
 
     try:
-        response = requests.post(f"{API_URL}?key={GEMINI_API_KEY}",
-                                 headers=headers,
-                                 json=payload)
+        response = _post_gemini(payload, "score")
         if response.status_code == 200:
             content = response.json(
             )["candidates"][0]["content"]["parts"][0]["text"]
-            scores = {
-                "logic": float(re.search(r"Logic.*?(\d+(?:\.\d+)?)", content).group(1)),
-                "relevance": float(re.search(r"Relevance.*?(\d+(?:\.\d+)?)", content).group(1)),
-                "persuasiveness": float(re.search(r"Persuasiveness.*?(\d+(?:\.\d+)?)", content).group(1))
-            }
+            scores = parse_scores(content)
+            SCORE_CACHE.insert(topic, argument, scores)
             return scores
+        error = RuntimeError(f"Gemini returned HTTP {response.status_code}")
     except Exception as e:
-        print(f"Error scoring argument: {e}")
+        error = e
+    print(f"Error scoring argument: {error}")
 
+    if not fallback:
+        raise error
     # Return default scores if API fails
-    return {"logic": 5.0, "relevance": 5.0, "persuasiveness": 5.0}
+    return dict(DEFAULT_SCORES)
+
+
+def stream_score_argument_turn(argument, topic, turn_number, fallback=True):
+    """
+    Score an argument with the streaming endpoint, yielding (criterion, score)
+    pairs as soon as each one can be read from the partial response.
+    Criteria the stream never produced are yielded with their heuristic score,
+    or the error is raised when fallback is False.
+    """
+    argument = compact_text(argument, ARGUMENT_TOKEN_BUDGET)
+    topic = compact_text(topic, TOPIC_TOKEN_BUDGET)
+    cached = SCORE_CACHE.lookup(topic, argument)
+    if cached is not None:
+        yield from cached.items()
+        return
+
+    payload = _score_payload(argument, topic, turn_number)
+    parser = ScoreStreamParser()
+    error = None
+
+    with span("gemini.stream_generate_content"):
+        try:
+            deadline = time.monotonic() + GEMINI_TIMEOUT
+            response = requests.post(f"{STREAM_API_URL}?alt=sse&key={GEMINI_API_KEY}",
+                                     headers={"Content-Type": "application/json"},
+                                     json=payload,
+                                     stream=True,
+                                     timeout=GEMINI_TIMEOUT)
+            with response:
+                if response.status_code == 200:
+                    usage = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        chunk = json.loads(line[len("data:"):])
+                        usage = chunk.get("usageMetadata", usage)
+                        for part in chunk["candidates"][0]["content"].get("parts", []):
+                            yield from parser.feed(part.get("text", ""))
+                        if parser.complete:
+                            break
+                        # The read timeout alone never trips while the model keeps sending
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"Score stream took longer than {GEMINI_TIMEOUT}s")
+                    yield from parser.close()
+                    ledger.record_response("score_stream", payload["contents"][0]["parts"][0]["text"], parser.buffer, usage)
+                    if parser.complete:
+                        SCORE_CACHE.insert(topic, argument, parser.scores)
+                    else:
+                        error = ValueError(f"Incomplete scores in response: {parser.buffer!r}")
+                else:
+                    error = RuntimeError(f"Gemini returned HTTP {response.status_code}")
+        except Exception as e:
+            error = e
+
+    if error is None:
+        return
+    print(f"Error streaming scores: {error}")
+    if not fallback:
+        raise error
+    estimate = heuristic_scores(argument, topic)
+    for criterion in SCORE_CRITERIA:
+        if criterion not in parser.scores:
+            yield criterion, estimate[criterion]
+
+
+_reasoning_markers = re.compile(
+    r"\b(because|since|therefore|thus|hence|if|unless|evidence|data|study|studies|research|"
+    r"for example|for instance|percent|compared)\b|\d+", re.IGNORECASE)
+
+
+def heuristic_scores(argument, topic):
+    """
+    Instant, model-free stand-in for score_argument_turn, used when Gemini
+    misses the round deadline. Rewards reasoning markers, substance and
+    lexical overlap with the topic, so a provisional round is rarely a tie.
+    """
+    argument = compact_text(argument, ARGUMENT_TOKEN_BUDGET)
+    topic = compact_text(topic, TOPIC_TOKEN_BUDGET)
+    words = len(argument.split())
+    reasoning = len(_reasoning_markers.findall(argument))
+    overlap = float(embed(argument) @ embed(topic))
+
+    def clamp(score):
+        return round(min(9.0, max(1.0, score)), 1)
+
+    return {
+        "logic": clamp(2.0 + min(4, reasoning) + min(2.0, words / 40)),
+        "relevance": clamp(2.0 + 12.0 * overlap),
+        "persuasiveness": clamp(2.0 + min(3.0, words / 25) + min(2.0, reasoning / 2))
+    }
+
+
+def provisional_round(player1_argument, player2_argument, topic, round_num):
+    """Heuristically score a round while the real scores are still being computed"""
+    return _round_result(round_num, heuristic_scores(player1_argument, topic),
+                         heuristic_scores(player2_argument, topic))
+
 
+def _round_result(round_num, p1_score, p2_score):
+    p1_total = sum(p1_score.values())
+    p2_total = sum(p2_score.values())
 
-def score_debate(player1_arguments, player2_arguments, topic):
+    # Determine round winner
+    if p1_total > p2_total:
+        round_winner = "Player 1"
+    elif p2_total > p1_total:
+        round_winner = "Player 2"
+    else:
+        round_winner = "Tie"
+
+    return {
+        "round": round_num,
+        "player1_score": p1_score,
+        "player2_score": p2_score,
+        "round_winner": round_winner
+    }
+
+
+@traced("score_round")
+def score_round(player1_argument, player2_argument, topic, round_num, player1_name=None, player2_name=None,
+                fallback=True):
+    """Score a single round (1-5) and decide its winner (see score_argument_turn for fallback)"""
+    with attribute(player=player1_name):
+        p1_score = score_argument_turn(player1_argument, topic, round_num, fallback)
+    with attribute(player=player2_name):
+        p2_score = score_argument_turn(player2_argument, topic, round_num, fallback)
+    return _round_result(round_num, p1_score, p2_score)
+
+
+def stream_score_round(player1_argument, player2_argument, topic, round_num, player1_name=None, player2_name=None,
+                       fallback=True):
+    """
+    Streaming version of score_round. Both arguments are scored concurrently and
+    events are yielded as they arrive:
+        {"type": "partial", "player": "player1", "criterion": "logic", "score": 8.0}
+        ...
+        {"type": "round", "result": <same dict as score_round>}
+    With fallback False, a failed argument raises once both are done instead of
+    yielding the round.
+    """
+    events = queue.Queue()
+    context = contextvars.copy_context()
+    errors = []
+
+    def produce(player, name, argument):
+        try:
+            with attribute(player=name):
+                for criterion, score in stream_score_argument_turn(argument, topic, round_num, fallback):
+                    events.put((player, criterion, score))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            events.put((player, None, None))
+
+    for player, name, argument in (("player1", player1_name, player1_argument),
+                                   ("player2", player2_name, player2_argument)):
+        threading.Thread(target=context.copy().run, args=(produce, player, name, argument), daemon=True).start()
+
+    scores = {"player1": {}, "player2": {}}
+    running = 2
+    while running:
+        player, criterion, score = events.get()
+        if criterion is None:
+            running -= 1
+            continue
+        scores[player][criterion] = score
+        yield {"type": "partial", "round": round_num, "player": player, "criterion": criterion, "score": score}
+
+    if errors:
+        raise errors[0]
+    ordered = {
+        player: {criterion: values[criterion] for criterion in SCORE_CRITERIA}
+        for player, values in scores.items()
+    }
+    yield {"type": "round", "result": _round_result(round_num, ordered["player1"], ordered["player2"])}
+
+
+@traced("score_debate")
+def score_debate(player1_arguments, player2_arguments, topic, rounds=None):
+    """
+    Score all 5 rounds. Rounds that were already scored while the debate was
+    running can be passed in `rounds` and are reused instead of re-scored.
+    """
+    scored = {r["round"]: r for r in (rounds or [])}
     rounds = []
     player1_rounds_won = 0
     player2_rounds_won = 0
 
     for round_num in range(5):
-        print(f"\nScoring Round {round_num + 1}...")
-
-        # Score both arguments for this round
-        p1_score = score_argument_turn(
-            player1_arguments[round_num], topic, round_num + 1)
-        p2_score = score_argument_turn(
-            player2_arguments[round_num], topic, round_num + 1)
-
-        # Calculate total scores for this round
-        p1_total = sum(p1_score.values())
-        p2_total = sum(p2_score.values())
+        if round_num + 1 in scored:
+            round_result = scored[round_num + 1]
+        else:
+            print(f"\nScoring Round {round_num + 1}...")
+            round_result = score_round(
+                player1_arguments[round_num], player2_arguments[round_num], topic, round_num + 1)
 
-        # Determine round winner
-        if p1_total > p2_total:
-            round_winner = "Player 1"
+        if round_result["round_winner"] == "Player 1":
             player1_rounds_won += 1
-        elif p2_total > p1_total:
-            round_winner = "Player 2"
+        elif round_result["round_winner"] == "Player 2":
             player2_rounds_won += 1
-        else:
-            round_winner = "Tie"
 
-        rounds.append({
-            "round": round_num + 1,
-            "player1_score": p1_score,
-            "player2_score": p2_score,
-            "round_winner": round_winner
-        })
+        rounds.append(round_result)
 
     return {
         "rounds": rounds,
@@ -256,8 +492,9 @@ def score_debate(player1_arguments, player2_arguments, topic):
     }
 
 
+@traced("run_debate")
 def run_debate(topic=None, player1_name="Player 1", player1_arguments=None,
-               player2_name="Player 2", player2_arguments=None, game_id=None):
+               player2_name="Player 2", player2_arguments=None, game_id=None, rounds=None):
 
     if topic is None:
         topic = generate_debate_topic()
@@ -266,7 +503,7 @@ def run_debate(topic=None, player1_name="Player 1", player1_arguments=None,
         raise ValueError("Both players must complete all 5 arguments")
 
     # Score the debate
-    scoring_results = score_debate(player1_arguments, player2_arguments, topic)
+    scoring_results = score_debate(player1_arguments, player2_arguments, topic, rounds)
 
     # Prepare debate data
     debate_data = {
@@ -295,6 +532,7 @@ def run_debate(topic=None, player1_name="Player 1", player1_arguments=None,
     return debate_data
 
 
+@traced("store_debate_result")
 def store_debate_result(debate_data):
     filename = f"debate_{debate_data['game_id']}.json"
 
@@ -303,12 +541,15 @@ def store_debate_result(debate_data):
 
     # Save to temporary file
     temp_file = f"tmp/{filename}"
-    with open(temp_file, "w") as file:
-        json.dump(debate_data, file, indent=4)
+    with span("store_debate_result.write_temp_file", path=temp_file):
+        with open(temp_file, "w") as file:
+            json.dump(debate_data, file, indent=4)
 
     try:
-        MINIO_CLIENT.fput_object(BUCKET_NAME, filename, temp_file)
-        print(f"[INFO] Debate history saved as {filename} in MinIO.")
+        object_name = storage.write_key("debate", str(debate_data['game_id']))
+        with span("minio.fput_object", object_name=object_name):
+            MINIO_CLIENT.fput_object(BUCKET_NAME, object_name, temp_file)
+        print(f"[INFO] Debate history saved as {object_name} in MinIO.")
     except Exception as e:
         print(f"[ERROR] MinIO storage error: {e}")
         print(f"Results saved locally at: {temp_file}")
@@ -0,0 +1,472 @@
+"""
+Precomputed debate analytics.
+
+Counters per genre, per topic and per player are updated as each debate is
+finalized or aborted and persisted as one compact rollup object, so the
+/stats endpoints never have to scan the debate archive. Updates go through a
+journal so that several workers can share the rollup (see AnalyticsRollup).
+Every counter row has the same fields (FIELDS); rates and averages are
+derived on read.
+
+    python analytics.py --rebuild   # recompute the rollup from the archive
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from io import BytesIO
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from minio import Minio
+from minio.error import S3Error
+
+import codec
+import storage
+from lobby import topic_key
+from tracing import span
+
+# How often a worker with new updates folds the journal into the rollup (and on shutdown)
+ANALYTICS_FOLD_SECONDS = float(os.getenv("ANALYTICS_FOLD_SECONDS", "30"))
+# How stale the served counters may get before they are reloaded from MinIO
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "30"))
+# A rebuild remembers the recent debates it read from the archive this long, so their
+# journal entries are skipped if they turn up after the rebuild listed the journal
+REBUILD_GRACE_SECONDS = 600
+ANALYTICS_OBJECT = "stats/rollup.json"
+JOURNAL_PREFIX = "stats/journal/"
+ROLLUP_VERSION = 2
+# Conditional writes attempted before a fold gives up until next time
+FOLD_ATTEMPTS = 5
+
+CRITERIA = ("logic", "relevance", "persuasiveness")
+# For genres and topics, wins/losses are from player 1's (the room creator's) side
+FIELDS = ("debates", "wins", "losses", "ties", "aborts", "forfeit_wins", "arguments") + CRITERIA
+DIMENSIONS = ("genres", "topics", "players")
+
+DebateFacts = Tuple[str, str, str, str, float, int, List[float], List[float]]
+AbortFacts = Tuple[str, str, str, str]
+
+
+def debate_facts(record: dict) -> Optional[DebateFacts]:
+    """(genre, topic, player1, player2, player1 score, rounds, player1 sums, player2 sums) of a finished debate"""
+    players = record.get("players", {})
+    p1 = players.get("player1", {}).get("name")
+    p2 = players.get("player2", {}).get("name")
+    if not p1 or not p2:
+        return None
+    winner = record.get("winner")
+    score = 1.0 if winner == p1 else 0.0 if winner == p2 else 0.5
+    sums1 = [0.0] * len(CRITERIA)
+    sums2 = [0.0] * len(CRITERIA)
+    rounds = record.get("rounds", [])
+    for round_result in rounds:
+        for i, criterion in enumerate(CRITERIA):
+            sums1[i] += float(round_result.get("player1_score", {}).get(criterion, 0))
+            sums2[i] += float(round_result.get("player2_score", {}).get(criterion, 0))
+    genre = (record.get("genre") or "any").lower()
+    return genre, topic_key(record.get("topic", "")), p1, p2, score, len(rounds), sums1, sums2
+
+
+def abort_facts(record: dict) -> Optional[AbortFacts]:
+    """(genre, topic, aborted_by, opponent) of an aborted debate"""
+    if not record.get("aborted_by"):
+        return None
+    genre = (record.get("genre") or "any").lower()
+    return genre, topic_key(record.get("topic", "")), record["aborted_by"], record.get("opponent") or ""
+
+
+def _group(keys: List[str], rows: np.ndarray) -> Dict[str, np.ndarray]:
+    """Sum counter rows that share a key"""
+    index: Dict[str, int] = {}
+    inverse = np.fromiter((index.setdefault(key, len(index)) for key in keys), dtype=np.int64, count=len(keys))
+    totals = np.column_stack([np.bincount(inverse, weights=rows[:, i], minlength=len(index))
+                              for i in range(len(FIELDS))])
+    return dict(zip(index, totals))
+
+
+def aggregate(debates: List[DebateFacts], aborts: List[AbortFacts]) -> Dict[str, Dict[str, np.ndarray]]:
+    """Turn debate and abort facts into counter rows per genre, topic and player"""
+    blocks = {dimension: ([], []) for dimension in DIMENSIONS}
+
+    def add(dimension, keys, rows):
+        blocks[dimension][0].extend(keys)
+        blocks[dimension][1].append(rows)
+
+    if debates:
+        genres, topics, p1, p2, score, rounds, sums1, sums2 = zip(*debates)
+        score = np.array(score)
+        rounds = np.array(rounds, dtype=np.float64)
+        sums1 = np.array(sums1, dtype=np.float64).reshape(-1, len(CRITERIA))
+        sums2 = np.array(sums2, dtype=np.float64).reshape(-1, len(CRITERIA))
+        ones = np.ones(len(score))
+        zeros = np.zeros(len(score))
+        win = (score == 1.0).astype(np.float64)
+        loss = (score == 0.0).astype(np.float64)
+        tie = (score == 0.5).astype(np.float64)
+
+        game = np.column_stack([ones, win, loss, tie, zeros, zeros, 2 * rounds, sums1 + sums2])
+        add("genres", genres, game)
+        add("topics", topics, game)
+        add("players", p1, np.column_stack([ones, win, loss, tie, zeros, zeros, rounds, sums1]))
+        add("players", p2, np.column_stack([ones, loss, win, tie, zeros, zeros, rounds, sums2]))
+
+    if aborts:
+        genres, topics, aborted_by, opponents = zip(*aborts)
+        abort = np.zeros((len(aborts), len(FIELDS)))
+        abort[:, FIELDS.index("aborts")] = 1
+        forfeit = np.zeros((len(aborts), len(FIELDS)))
+        forfeit[:, FIELDS.index("forfeit_wins")] = 1
+        add("genres", genres, abort)
+        add("topics", topics, abort)
+        add("players", aborted_by, abort)
+        named = [i for i, opponent in enumerate(opponents) if opponent]
+        add("players", [opponents[i] for i in named], forfeit[named])
+
+    return {dimension: _group(keys, np.vstack(rows)) if keys else {}
+            for dimension, (keys, rows) in blocks.items()}
+
+
+def _rate(part, whole) -> Optional[float]:
+    return round(part / whole, 4) if whole else None
+
+
+def describe(counters: List[float], player: bool = False) -> dict:
+    """Counters plus the rates and averages dashboards need"""
+    c = dict(zip(FIELDS, counters))
+    started = c["debates"] + c["aborts"] + (c["forfeit_wins"] if player else 0)
+    view = {field: int(c[field]) for field in FIELDS[:7]}
+    view.update({
+        "win_rate": _rate(c["wins"], c["debates"]),
+        "tie_rate": _rate(c["ties"], c["debates"]),
+        "abort_rate": _rate(c["aborts"], started),
+        "average_scores": {criterion: _rate(c[criterion], c["arguments"]) for criterion in CRITERIA}
+    })
+    return view
+
+
+def _age_seconds(timestamp) -> float:
+    """Seconds since a record's (naive UTC) timestamp; infinite if it can't be parsed"""
+    try:
+        return (datetime.utcnow() - datetime.fromisoformat(str(timestamp))).total_seconds()
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def _journal_key(kind: str, game_id) -> str:
+    return f"{JOURNAL_PREFIX}{int(time.time() * 1000):013d}-{kind}-{game_id or uuid.uuid4().hex}.json"
+
+
+def _parse_journal_key(key: str) -> Tuple[float, str]:
+    """(written at, update id) of a journal object; the update id is "<kind>:<game id>" """
+    millis, kind, game_id = key[len(JOURNAL_PREFIX):-len(".json")].split("-", 2)
+    return int(millis) / 1000, f"{kind}:{game_id}"
+
+
+def _merge_rows(counters: Dict[str, Dict[str, np.ndarray]], rows: Dict[str, Dict[str, np.ndarray]]):
+    for dimension, by_key in rows.items():
+        target = counters[dimension]
+        for key, row in by_key.items():
+            target[key] = target[key] + row if key in target else row
+
+
+def _copy(counters: Dict[str, Dict[str, np.ndarray]]) -> Dict[str, Dict[str, np.ndarray]]:
+    # Rows are replaced, never modified in place, so copying the dicts is enough
+    return {dimension: dict(rows) for dimension, rows in counters.items()}
+
+
+class AnalyticsRollup:
+    """
+    Counters shared by every worker through MinIO.
+
+    Each update is written as its own journal object (stats/journal/...) the
+    moment it happens, so a crash loses nothing. A background task calls
+    save() every ANALYTICS_FOLD_SECONDS to fold the journal into the rollup
+    object with a conditional write, retrying if another worker folded first,
+    and then deletes the folded journal objects. Until they are deleted the
+    rollup lists them ("folded"), so an update is counted once however many
+    workers fold it; the journal and that list only ever hold about one fold
+    interval of updates. Reads use the rollup plus unfolded journal entries,
+    refreshed every ANALYTICS_REFRESH_SECONDS.
+    """
+
+    def __init__(self, minio_client: Minio, bucket_name: str):
+        self.minio_client = minio_client
+        self.bucket_name = bucket_name
+        self._lock = threading.Lock()
+        self._fold_lock = threading.Lock()
+        self._refreshed_at = None
+        self._counters: Dict[str, Dict[str, np.ndarray]] = {dimension: {} for dimension in DIMENSIONS}
+        self._dirty = 0
+        self.generated_at = None
+
+    def _record(self, kind: str, game_id, facts, rows: Dict[str, Dict[str, np.ndarray]]):
+        entry = codec.dumps({"kind": kind, "game_id": game_id, "facts": facts})
+        key = _journal_key(kind, game_id)
+        try:
+            with span("minio.put_object", object_name=key):
+                self.minio_client.put_object(self.bucket_name, key, BytesIO(entry), length=len(entry))
+        except Exception as e:
+            print(f"[ERROR] Could not journal analytics update {key}: {e}")
+        with self._lock:
+            _merge_rows(self._counters, rows)
+            self._dirty += 1
+
+    def pending(self) -> bool:
+        """Whether this worker has journalled updates since its last fold"""
+        with self._lock:
+            return self._dirty > 0
+
+    def record_debate(self, record: dict):
+        facts = debate_facts(record)
+        if facts is not None:
+            self._record("debate", record.get("game_id"), facts, aggregate([facts], []))
+
+    def record_abort(self, record: dict):
+        facts = abort_facts(record)
+        if facts is not None:
+            self._record("abort", record.get("game_id"), facts, aggregate([], [facts]))
+
+    def _read_rollup(self) -> Tuple[Optional[dict], Optional[str]]:
+        """The stored rollup (None if missing or in another layout) and its ETag (None if missing)"""
+        try:
+            etag = self.minio_client.stat_object(self.bucket_name, ANALYTICS_OBJECT).etag
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None, None
+            raise
+        # Read after the stat: if the rollup changes in between, the write-back's If-Match fails
+        rollup = json.loads(self.minio_client.get_object(self.bucket_name, ANALYTICS_OBJECT).read())
+        if rollup.get("version") != ROLLUP_VERSION or tuple(rollup.get("fields", ())) != FIELDS:
+            print("[INFO] Ignoring analytics rollup with a different layout; run a rebuild")
+            return None, etag
+        return rollup, etag
+
+    def _list_journal(self) -> Dict[str, Tuple[float, str]]:
+        objects = self.minio_client.list_objects(self.bucket_name, prefix=JOURNAL_PREFIX, recursive=True)
+        return {obj.object_name: _parse_journal_key(obj.object_name) for obj in objects}
+
+    def _read_entry(self, key: str) -> Optional[Dict[str, Dict[str, np.ndarray]]]:
+        try:
+            entry = codec.loads(self.minio_client.get_object(self.bucket_name, key).read())
+        except Exception as e:
+            # Deleted by a fold that has already written a newer rollup
+            print(f"[INFO] Skipping analytics journal entry {key}: {e}")
+            return None
+        if entry["kind"] == "debate":
+            return aggregate([entry["facts"]], [])
+        return aggregate([], [entry["facts"]])
+
+    def _combine(self, rollup: Optional[dict], journal: Dict[str, Tuple[float, str]]):
+        """Stored counters plus every journal entry they don't include yet"""
+        rollup = rollup or {}
+        counters = {dimension: {key: np.array(row, dtype=np.float64) for key, row in rollup.get(dimension, {}).items()}
+                    for dimension in DIMENSIONS}
+        folded: Dict[str, float] = dict(rollup.get("folded", {}))
+        covered = rollup.get("covered", {})
+        for key, (written_at, update_id) in sorted(journal.items()):
+            if update_id in folded:
+                continue
+            if update_id not in covered:
+                rows = self._read_entry(key)
+                if rows is None:
+                    continue
+                _merge_rows(counters, rows)
+            folded[update_id] = written_at
+        return counters, folded
+
+    def _write(self, counters, folded: Dict[str, float], covered: Dict[str, float],
+               journal: Dict[str, Tuple[float, str]], generated_at: Optional[str], etag: Optional[str]) -> bool:
+        """Store the rollup if nobody else has since the ETag was read"""
+        listed = {update_id for _, update_id in journal.values()}
+        horizon = time.time() - REBUILD_GRACE_SECONDS
+        rollup = {
+            "version": ROLLUP_VERSION,
+            "fields": FIELDS,
+            "generated_at": generated_at,
+            "saved_at": datetime.utcnow().isoformat(),
+            # Folded updates whose journal objects are still there (about to be deleted)
+            "folded": {update_id: written_at for update_id, written_at in folded.items() if update_id in listed},
+            # Recent debates a rebuild counted from the archive
+            "covered": {update_id: read_at for update_id, read_at in covered.items() if read_at >= horizon}
+        }
+        for dimension, rows in counters.items():
+            # Counts are whole numbers; only the score sums need decimals
+            rollup[dimension] = {key: [int(v) if float(v).is_integer() else round(float(v), 2) for v in row]
+                                 for key, row in rows.items()}
+        data = json.dumps(rollup, separators=(",", ":")).encode('utf-8')
+        if etag is None:
+            return storage.create_object(self.minio_client, self.bucket_name, ANALYTICS_OBJECT, data)
+        return storage.replace_object(self.minio_client, self.bucket_name, ANALYTICS_OBJECT, data, etag)
+
+    def _publish(self, counters, generated_at: Optional[str], folded_updates: int = 0):
+        with self._lock:
+            self._counters = counters
+            self.generated_at = generated_at
+            self._refreshed_at = time.monotonic()
+            self._dirty = max(0, self._dirty - folded_updates)
+
+    def _prune(self, journal: Dict[str, Tuple[float, str]], folded: Dict[str, float]):
+        """Delete the journal entries the stored rollup now includes"""
+        for key, (_, update_id) in journal.items():
+            if update_id in folded:
+                try:
+                    self.minio_client.remove_object(self.bucket_name, key)
+                except Exception as e:
+                    print(f"[WARN] Could not delete analytics journal entry {key}: {e}")
+
+    def _refresh(self):
+        """Reload the view if it is older than ANALYTICS_REFRESH_SECONDS"""
+        with self._lock:
+            if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < ANALYTICS_REFRESH_SECONDS:
+                return
+        with self._fold_lock:
+            try:
+                rollup, _ = self._read_rollup()
+                counters, _ = self._combine(rollup, self._list_journal())
+            except Exception as e:
+                print(f"[INFO] No analytics rollup loaded: {e}")
+                with self._lock:
+                    self._refreshed_at = time.monotonic()
+                return
+            self._publish(counters, (rollup or {}).get("generated_at"))
+
+    def get(self, dimension: str, key: str) -> Optional[dict]:
+        self._refresh()
+        with self._lock:
+            row = self._counters[dimension].get(key)
+        if row is None:
+            return None
+        return describe(row.tolist(), player=dimension == "players")
+
+    def genre(self, genre: str) -> Optional[dict]:
+        return self.get("genres", genre.lower())
+
+    def topic(self, topic: str) -> Optional[dict]:
+        return self.get("topics", topic_key(topic))
+
+    def player(self, username: str) -> Optional[dict]:
+        return self.get("players", username)
+
+    def genres(self) -> Dict[str, dict]:
+        self._refresh()
+        with self._lock:
+            rows = {genre: row.tolist() for genre, row in self._counters["genres"].items()}
+        return {genre: describe(row) for genre, row in rows.items()}
+
+    def top_topics(self, limit: int = 20) -> List[dict]:
+        self._refresh()
+        with self._lock:
+            rows = sorted(self._counters["topics"].items(), key=lambda item: -item[1][0])[:limit]
+        return [{"topic": topic, **describe(row.tolist())} for topic, row in rows]
+
+    def save(self) -> bool:
+        """Fold the journal into the stored rollup"""
+        with self._lock:
+            pending = self._dirty
+        with self._fold_lock:
+            try:
+                for _ in range(FOLD_ATTEMPTS):
+                    rollup, etag = self._read_rollup()
+                    journal = self._list_journal()
+                    counters, folded = self._combine(rollup, journal)
+                    rollup = rollup or {}
+                    generated_at = rollup.get("generated_at")
+                    if self._write(counters, folded, rollup.get("covered", {}), journal, generated_at, etag):
+                        self._publish(counters, generated_at, pending)
+                        self._prune(journal, folded)
+                        return True
+                print("[WARN] Analytics rollup kept changing while folding; the journal will be folded next time")
+            except Exception as e:
+                print(f"[ERROR] Could not save analytics rollup: {e}")
+            return False
+
+    def rebuild(self) -> dict:
+        """Recompute every counter from the debate archive and replace the rollup"""
+        start = time.perf_counter()
+
+        def decode(kind):
+            facts = debate_facts if kind == "debate" else abort_facts
+
+            def one(data):
+                record = codec.loads(data)
+                return f"{kind}:{record.get('game_id')}", record.get("timestamp"), facts(record)
+            return one
+
+        with span("analytics.load_archive"):
+            debates = storage.load_all(self.minio_client, self.bucket_name, "debate", decode("debate"))
+            aborts = storage.load_all(self.minio_client, self.bucket_name, "abort", decode("abort"))
+        loaded = time.perf_counter()
+        with span("analytics.aggregate", debates=len(debates), aborts=len(aborts)):
+            base = aggregate([facts for _, _, facts in debates if facts is not None],
+                             [facts for _, _, facts in aborts if facts is not None])
+        aggregated = time.perf_counter()
+
+        # Updates the archive already covers; recent ones are remembered in "covered" because
+        # their journal entries may be written only after the journal is listed below
+        covered = {update_id for update_id, _, _ in debates + aborts}
+        now = time.time()
+        recent = {update_id: now for update_id, timestamp, _ in debates + aborts
+                  if _age_seconds(timestamp) <= REBUILD_GRACE_SECONDS}
+
+        generated_at = datetime.utcnow().isoformat()
+        with self._lock:
+            pending = self._dirty
+        with self._fold_lock:
+            for _ in range(FOLD_ATTEMPTS):
+                _, etag = self._read_rollup()
+                journal = self._list_journal()
+                counters, folded = _copy(base), {}
+                for key, (written_at, update_id) in sorted(journal.items()):
+                    # Journalled after the archive was read: not in the base counters yet
+                    if update_id not in covered and update_id not in folded:
+                        rows = self._read_entry(key)
+                        if rows is not None:
+                            _merge_rows(counters, rows)
+                    folded[update_id] = written_at
+                if self._write(counters, folded, recent, journal, generated_at, etag):
+                    self._publish(counters, generated_at, pending)
+                    self._prune(journal, folded)
+                    break
+            else:
+                raise RuntimeError("Analytics rollup kept changing during the rebuild; try again")
+        return {
+            "debates": len(debates),
+            "aborts": len(aborts),
+            **{dimension: len(rows) for dimension, rows in counters.items()},
+            "journal_entries": len(journal),
+            "load_seconds": round(loaded - start, 3),
+            "aggregate_seconds": round(aggregated - loaded, 3),
+            "total_seconds": round(time.perf_counter() - start, 3)
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **{dimension: len(rows) for dimension, rows in self._counters.items()},
+                "unsaved_updates": self._dirty,
+                "generated_at": self.generated_at
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Rebuild the analytics rollup from the debate archive")
+    parser.add_argument("--rebuild", action="store_true", help="recompute and publish the rollup")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        load_dotenv()
+        client = Minio(
+            os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+            access_key=os.getenv("MINIO_ACCESS_KEY"),
+            secret_key=os.getenv("MINIO_SECRET_KEY"),
+            secure=False
+        )
+        print(json.dumps(AnalyticsRollup(client, "debate-history").rebuild(), indent=2))
+    else:
+        parser.print_help()
@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import string
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+MATCH_BAND_WIDTH = float(os.getenv("MATCH_BAND_WIDTH", "100"))
+# A waiting player's search widens by one band every this many seconds
+MATCH_WIDEN_SECONDS = float(os.getenv("MATCH_WIDEN_SECONDS", "10"))
+MATCH_MAX_BAND_DISTANCE = int(os.getenv("MATCH_MAX_BAND_DISTANCE", "5"))
+
+
+def topic_key(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+
+class RoomKeyAllocator:
+    """
+    Random room keys that are guaranteed not to collide with a key in use.
+
+    Keys in use by this process are tracked in memory. `reserve`, if given,
+    claims a candidate key in shared storage and returns False if another
+    worker (or an earlier run) already has it, so keys are unique across
+    workers and restarts. It may block, so call allocate() off the event loop.
+    """
+
+    def __init__(self, length: int = 6, alphabet: str = string.ascii_uppercase + string.digits,
+                 reserve: Optional[Callable[[str], bool]] = None):
+        self.length = length
+        self.alphabet = alphabet
+        self.reserve = reserve
+        self._in_use: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        while True:
+            # Retries are rare until the key space is nearly exhausted; grow the key when it is
+            for _ in range(16):
+                key = ''.join(random.choices(self.alphabet, k=self.length))
+                with self._lock:
+                    if key in self._in_use:
+                        continue
+                    self._in_use.add(key)
+                if self.reserve is None or self.reserve(key):
+                    return key
+                self.release(key)
+            self.length += 1
+
+    def release(self, key: str):
+        """Forget a key once its room has ended (a reserved key stays claimed in storage)"""
+        with self._lock:
+            self._in_use.discard(key)
+
+
+class Lobby:
+    """Indexes of rooms waiting for a second player, by genre and by topic"""
+
+    def __init__(self):
+        # Insertion-ordered dicts used as sets, so the oldest waiting room comes first
+        self._by_genre: Dict[str, Dict[str, None]] = {}
+        self._by_topic: Dict[str, Dict[str, None]] = {}
+        self._rooms: Dict[str, Tuple[str, str]] = {}
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def add(self, room_key: str, genre: Optional[str], topic: str):
+        genre = (genre or "any").lower()
+        topic = topic_key(topic)
+        self._rooms[room_key] = (genre, topic)
+        self._by_genre.setdefault(genre, {})[room_key] = None
+        self._by_topic.setdefault(topic, {})[room_key] = None
+
+    def remove(self, room_key: str):
+        entry = self._rooms.pop(room_key, None)
+        if entry is None:
+            return
+        genre, topic = entry
+        for index, key in ((self._by_genre, genre), (self._by_topic, topic)):
+            rooms = index.get(key)
+            if rooms is not None:
+                rooms.pop(room_key, None)
+                if not rooms:
+                    del index[key]
+
+    def waiting(self, genre: Optional[str] = None, topic: Optional[str] = None, limit: int = 20) -> List[str]:
+        """Oldest-first keys of waiting rooms, filtered by genre and/or topic"""
+        if topic is not None:
+            candidates = self._by_topic.get(topic_key(topic), {})
+            if genre is not None:
+                genre = genre.lower()
+                candidates = (k for k in candidates if self._rooms[k][0] == genre)
+        elif genre is not None:
+            candidates = self._by_genre.get(genre.lower(), {})
+        else:
+            candidates = self._rooms
+        keys = []
+        for room_key in candidates:
+            keys.append(room_key)
+            if len(keys) >= limit:
+                break
+        return keys
+
+
+class Ticket:
+    def __init__(self, player: str, rating: float, genre: str, topic: Optional[str]):
+        self.player = player
+        self.rating = rating
+        self.genre = genre
+        self.topic = topic
+        self.band = int(rating // MATCH_BAND_WIDTH)
+        self.enqueued_at = time.monotonic()
+
+    def reach(self) -> int:
+        """How many bands away this ticket is willing to match, widening while it waits"""
+        waited = time.monotonic() - self.enqueued_at
+        return min(MATCH_MAX_BAND_DISTANCE, 1 + int(waited // MATCH_WIDEN_SECONDS))
+
+
+class MatchQueue:
+    """
+    Pairs queued players by genre and rating band. Each (genre, band) has its
+    own FIFO, so finding an opponent only looks at the few neighbouring bands
+    a ticket can reach, never at the whole queue.
+    """
+
+    def __init__(self):
+        self._bands: Dict[Tuple[str, int], "OrderedDict[str, Ticket]"] = {}
+        self._tickets: Dict[str, Ticket] = {}
+        # player -> (room_key, opponent) for matches the player hasn't seen yet
+        self.matched: Dict[str, Tuple[str, str]] = {}
+        self.matches_made = 0
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def ticket(self, player: str) -> Optional[Ticket]:
+        return self._tickets.get(player)
+
+    def enqueue(self, player: str, rating: float, genre: str, topic: Optional[str] = None) -> Optional[Tuple[Ticket, Ticket]]:
+        """Queue a player, or pair them immediately if an opponent is in reach"""
+        self.leave(player)
+        self.matched.pop(player, None)
+        ticket = Ticket(player, rating, genre.lower(), topic)
+        opponent = self._find_opponent(ticket)
+        if opponent is not None:
+            return opponent, ticket
+        self._tickets[player] = ticket
+        self._bands.setdefault((ticket.genre, ticket.band), OrderedDict())[player] = ticket
+        return None
+
+    def retry(self, player: str) -> Optional[Tuple[Ticket, Ticket]]:
+        """Look again for a waiting player whose search window has widened"""
+        ticket = self._tickets.get(player)
+        if ticket is None:
+            return None
+        self._remove(ticket)
+        opponent = self._find_opponent(ticket)
+        if opponent is not None:
+            return opponent, ticket
+        self._tickets[player] = ticket
+        self._bands.setdefault((ticket.genre, ticket.band), OrderedDict())[player] = ticket
+        return None
+
+    def unmatch(self, first: Ticket, second: Ticket):
+        """Put a pair that couldn't be started back in the queue, keeping their place"""
+        for ticket in (first, second):
+            if ticket.player in self._tickets:
+                continue
+            self._tickets[ticket.player] = ticket
+            key = (ticket.genre, ticket.band)
+            queue = self._bands.setdefault(key, OrderedDict())
+            queue[ticket.player] = ticket
+            self._bands[key] = OrderedDict(sorted(queue.items(), key=lambda item: item[1].enqueued_at))
+        self.matches_made -= 1
+
+    def leave(self, player: str) -> bool:
+        ticket = self._tickets.get(player)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        return True
+
+    def _remove(self, ticket: Ticket):
+        del self._tickets[ticket.player]
+        queue = self._bands.get((ticket.genre, ticket.band))
+        if queue is not None:
+            queue.pop(ticket.player, None)
+            if not queue:
+                del self._bands[(ticket.genre, ticket.band)]
+
+    def _find_opponent(self, ticket: Ticket) -> Optional[Ticket]:
+        """Pop the longest-waiting compatible ticket within reach of both players"""
+        best = None
+        for distance in range(ticket.reach() + 1):
+            for band in {ticket.band - distance, ticket.band + distance}:
+                queue = self._bands.get((ticket.genre, band))
+                if not queue:
+                    continue
+                for candidate in queue.values():
+                    if candidate.reach() < distance:
+                        continue
+                    if ticket.topic and candidate.topic and topic_key(ticket.topic) != topic_key(candidate.topic):
+                        continue
+                    if best is None or candidate.enqueued_at < best.enqueued_at:
+                        best = candidate
+                    break
+            if best is not None:
+                break
+        if best is not None:
+            self._remove(best)
+            self.matches_made += 1
+        return best
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._tickets),
+            "bands": len(self._bands),
+            "matches_made": self.matches_made
+        }
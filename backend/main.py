@@ -1,16 +1,30 @@
-from fastapi import FastAPI, HTTPException, Query
-from models import Player, Room, JoinRoom, Argument, TopicResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Header, Depends, Response
+from models import Player, Room, JoinRoom, Argument, TopicResponse, ProfilingConfig, BatchOperation, BatchRequest
 from player_service import PlayerService
+from room_snapshots import RoomSnapshots
+import singleflight
+from singleflight import single_flight
+from admission import AdmissionController, AdmissionRejected
+from token_budget import ledger, attribute
+from lobby import Lobby, MatchQueue, RoomKeyAllocator, Ticket
+import storage
+import codec
+from analytics import AnalyticsRollup, ANALYTICS_FOLD_SECONDS
+import tracing
+from tracing import span
 import os
 from dotenv import load_dotenv
 from minio import Minio
-from ai_engine import run_debate, generate_debate_topics_by_genre
+from ai_engine import run_debate, generate_debate_topics_by_genre, score_round, stream_score_round, provisional_round, SCORE_CACHE
 import random
-import string
 import json
-from io import BytesIO
+import datetime
+import asyncio
 import uvicorn
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import iterate_in_threadpool
 
 
 # Load environment variables
@@ -29,12 +43,50 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=36000
 )
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Wrap every request in a root span and optionally profile it"""
+    profiler = tracing.profiling.maybe_start()
+    root = None
+    try:
+        with span(f"{request.method} {request.url.path}") as root:
+            response = await call_next(request)
+            if root is not None:
+                route = request.scope.get("route")
+                if route is not None:
+                    root.name = f"{request.method} {route.path}"
+                root.set("status_code", response.status_code)
+                response.headers["X-Trace-Id"] = root.trace_id
+    finally:
+        if profiler is not None:
+            # Joins the sampling thread and writes the profile
+            await asyncio.to_thread(tracing.profiling.finish, profiler, root.trace_id if root is not None else None)
+    return response
+
 # MinIO Configuration
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "localhost:9000")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY")
 MINIO_BUCKET = "debate-history"
 
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Admission control for endpoints that call Gemini
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_PER_PLAYER_LIMIT = int(os.getenv("LLM_PER_PLAYER_LIMIT", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_MAX_WAIT = float(os.getenv("LLM_MAX_WAIT", "10"))
+
+# Seconds a submission waits for a round's scores before answering with a provisional
+# score and reconciling in the background (0 waits indefinitely)
+ROUND_SCORING_DEADLINE = float(os.getenv("ROUND_SCORING_DEADLINE", "8"))
+# Seconds between keep-alive comments on an idle /room-events stream
+ROOM_EVENTS_KEEPALIVE = float(os.getenv("ROOM_EVENTS_KEEPALIVE", "15"))
+# Seconds a finished room stays in memory (and readable) before it is dropped
+ROOM_RETENTION = float(os.getenv("ROOM_RETENTION", "300"))
+
 if(MINIO_ACCESS_KEY is None or MINIO_SECRET_KEY is None):
     raise ValueError("MINIO_ACCESS_KEY and MINIO_SECRET_KEY must be set in the environment variables.")
 
@@ -60,12 +112,68 @@ if not minio_client.bucket_exists(MINIO_BUCKET):
     minio_client.make_bucket(MINIO_BUCKET)
     
 player_service = PlayerService(minio_client, MINIO_BUCKET)
+analytics = AnalyticsRollup(minio_client, MINIO_BUCKET)
 
 debate_rooms: dict[str, dict] = {}
+room_snapshots = RoomSnapshots()
+
+def reserve_room_key(room_key: str) -> bool:
+    """Claim a room key in MinIO for good; False if any worker has ever used it"""
+    marker = codec.dumps({"room_key": room_key, "reserved_at": datetime.datetime.utcnow()})
+    return storage.create_object(minio_client, MINIO_BUCKET, storage.sharded_key("room", room_key), marker)
+
+room_keys = RoomKeyAllocator(reserve=reserve_room_key)
+# Waiting rooms by genre/topic, and players queued for a rating-banded match
+lobby = Lobby()
+matchmaking = MatchQueue()
+# Keeps references to fire-and-forget tasks so they aren't garbage collected mid-run
+background_tasks: set = set()
+# Rooms whose final result is being computed, so it only happens once
+finalizing_rooms: set = set()
+
+llm_admission = AdmissionController(
+    "llm",
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    per_key_limit=LLM_PER_PLAYER_LIMIT,
+    max_queue=LLM_MAX_QUEUE,
+    max_wait=LLM_MAX_WAIT
+)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Shed requests with 429/503 and a Retry-After hint"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
-def generate_room_key(length: int = 6) -> str:
-    """Generate a random room key"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+def require_admin(x_admin_token: str = Header(None)):
+    """Reject requests that don't carry the configured admin token"""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+async def generate_room_key() -> str:
+    """Generate a random room key that no other room, on any worker, has used"""
+    return await asyncio.to_thread(room_keys.allocate)
+
+def _room_ended(room_key: str):
+    """Once a room is completed, aborted or failed, drop it after ROOM_RETENTION seconds"""
+    task = asyncio.create_task(_retire_room(room_key))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def _retire_room(room_key: str):
+    """Free a finished room's memory; the debate itself is archived in MinIO"""
+    await asyncio.sleep(ROOM_RETENTION)
+    room = debate_rooms.pop(room_key, None)
+    room_snapshots.discard(room_key)
+    lobby.remove(room_key)
+    room_keys.release(room_key)
+    if room is not None:
+        for player in (room["player1_name"], room["player2_name"]):
+            if matchmaking.matched.get(player, (None,))[0] == room_key:
+                del matchmaking.matched[player]
 
 #0. Health check
 @app.get("/")
@@ -105,70 +213,84 @@ async def get_player_history(username: str):
     
    
     all_players = await player_service.get_all_players()
+    player_rank = _player_rank(all_players, username)
     
-    ranked_players = sorted(all_players, key=lambda x: x.total_score, reverse=True)
-    player_rank = next((i + 1 for i, p in enumerate(ranked_players) if p.username == username), None)
-    
-    debate_history = []
-    try:
-        objects = minio_client.list_objects(MINIO_BUCKET, prefix="debate_", recursive=True)
-        for obj in objects:
-            try:
-                response = minio_client.get_object(MINIO_BUCKET, obj.object_name)
-                data = json.loads(response.read().decode('utf-8'))
-                
-                if data.get("players", {}).get("player1", {}).get("name") == username or \
-                   data.get("players", {}).get("player2", {}).get("name") == username:
-                    debate_history.append(data)
-            except:
-                continue
-    except Exception as e:
-        print(f"Error fetching debate history: {e}")
+    debate_history = await player_service.get_debate_history(username)
     
     return {
         "player": player,
         "rank": player_rank,
-        "total_players": len(ranked_players),
+        "total_players": len(all_players),
         "debate_history": debate_history
     }
 
+def _player_rank(all_players: list, username: str):
+    """1-based leaderboard position by total score, or None for an unknown player"""
+    ranked_players = sorted(all_players, key=lambda x: x.total_score, reverse=True)
+    return next((i + 1 for i, p in enumerate(ranked_players) if p.username == username), None)
+
 # 4. Send list of genres
 @app.get("/genres")
 async def get_genres():
     """Get list of available debate genres"""
     return {"genres": VALID_GENRES}
 
-@app.get("/topics/{genre}", response_model=TopicResponse)
-async def get_debate_topics(genre: str):
-    """Get three debate topics for a specific genre"""
+@single_flight("topics")
+async def load_topics(genre: str) -> dict:
+    """
+    Generate topics off the event loop. Concurrent requests for a genre share
+    one Gemini call, and only that call takes an LLM admission slot.
+    """
+    async with llm_admission.admit():
+        return await asyncio.to_thread(generate_debate_topics_by_genre, genre)
+
+async def admitted_topics(genre: str) -> dict:
+    """Validate the genre and load its topics under the LLM admission limit"""
     if genre.lower() not in VALID_GENRES:
         raise HTTPException(
             status_code=400,
             detail={"error": "Invalid genre", "valid_genres": VALID_GENRES}
         )
 
-    topics = generate_debate_topics_by_genre(genre)
-    return topics
+    return await load_topics(genre.lower())
+
+@app.get("/topics/{genre}", response_model=TopicResponse)
+async def get_debate_topics(genre: str):
+    """Get three debate topics for a specific genre"""
+    return await admitted_topics(genre)
 
 @app.post("/create-room/{player_name}")
-async def create_room(player_name: str, topic: str = Query(..., description="Selected debate topic")):
+async def create_room(
+    player_name: str,
+    topic: str = Query(..., description="Selected debate topic"),
+    genre: str = Query(None, description="Genre the topic was picked from, used by the lobby")
+):
     """Create a new debate room with the selected topic"""
+    if genre is not None and genre.lower() not in VALID_GENRES:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "Invalid genre", "valid_genres": VALID_GENRES}
+        )
+
     player = await player_service.get_player(player_name)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
     # Generate room key
-    room_key = generate_room_key()
+    room_key = await generate_room_key()
 
     # Create room
     room = Room(
         room_key=room_key,
         topic=topic.strip(),
+        genre=genre.lower() if genre else None,
         player1_name=player_name,
         arguments={player_name: []}
     )
 
     debate_rooms[room_key] = room.dict()
+    room_snapshots.commit(room_key, debate_rooms[room_key])
+    lobby.add(room_key, room.genre, room.topic)
     return {"room_key": room_key, "topic": topic}
 
 
@@ -191,13 +313,155 @@ async def join_room(room_key: str, join_request: JoinRoom):
     room["status"] = "in_progress"
     room["current_turn"] = room["player1_name"]
     room["arguments"][join_request.player_name] = []
+    room_snapshots.commit(room_key, room)
+    lobby.remove(room_key)
 
     return {"message": "Joined successfully", "room": room}
 
-#Submit arguments for each round
-@app.post("/submit-argument/{room_key}/{player_name}")
-async def submit_argument(room_key: str, player_name: str, argument: Argument):
-    """Submit an argument for the current round"""
+# Precomputed analytics
+@app.get("/stats/genres")
+async def get_genre_stats():
+    """Win, tie and abort rates and average scores for every genre"""
+    return {"genres": await asyncio.to_thread(analytics.genres)}
+
+@app.get("/stats/genres/{genre}")
+async def get_genre_stat(genre: str):
+    """Win, tie and abort rates and average scores for one genre"""
+    stats = await asyncio.to_thread(analytics.genre, genre)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No debates recorded for this genre")
+    return {"genre": genre.lower(), **stats}
+
+@app.get("/stats/topics")
+async def get_topic_stats(
+    topic: str = Query(None, description="A single topic; omit to list the most debated topics"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Win, tie and abort rates and average scores per topic"""
+    if topic is None:
+        return {"topics": await asyncio.to_thread(analytics.top_topics, limit)}
+    stats = await asyncio.to_thread(analytics.topic, topic)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No debates recorded for this topic")
+    return {"topic": topic, **stats}
+
+@app.get("/stats/players/{username}")
+async def get_player_stats(username: str):
+    """A player's record, abort rate and average logic/relevance/persuasiveness"""
+    stats = await asyncio.to_thread(analytics.player, username)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No debates recorded for this player")
+    return {"username": username, **stats}
+
+# Lobby and matchmaking
+@app.get("/lobby/rooms")
+async def get_open_rooms(
+    genre: str = Query(None, description="Only rooms in this genre"),
+    topic: str = Query(None, description="Only rooms on this topic"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """List rooms waiting for a second player, oldest first"""
+    rooms = []
+    for room_key in lobby.waiting(genre, topic, limit):
+        room = debate_rooms[room_key]
+        rooms.append({
+            "room_key": room_key,
+            "topic": room["topic"],
+            "genre": room["genre"],
+            "player1_name": room["player1_name"],
+            "created_at": room["created_at"]
+        })
+    return {"rooms": rooms, "total_waiting": len(lobby)}
+
+async def _start_matched_debate(first: Ticket, second: Ticket) -> str:
+    """Open an in-progress room for two matched players; the longer-waiting player goes first"""
+    topic = first.topic or second.topic
+    if not topic:
+        try:
+            topic = random.choice((await admitted_topics(first.genre))["topics"])
+        except AdmissionRejected:
+            # Shed: both players wait on in the queue and can poll again after Retry-After
+            matchmaking.unmatch(first, second)
+            raise
+
+    room_key = await generate_room_key()
+    room = Room(
+        room_key=room_key,
+        topic=topic.strip(),
+        genre=first.genre,
+        player1_name=first.player,
+        player2_name=second.player,
+        status="in_progress",
+        current_turn=first.player,
+        arguments={first.player: [], second.player: []}
+    )
+    debate_rooms[room_key] = room.dict()
+    room_snapshots.commit(room_key, debate_rooms[room_key])
+
+    matchmaking.matched[first.player] = (room_key, second.player)
+    matchmaking.matched[second.player] = (room_key, first.player)
+    return room_key
+
+def _match_status(player_name: str) -> dict:
+    room_key, opponent = matchmaking.matched[player_name]
+    return {"status": "matched", "room_key": room_key, "opponent": opponent, "topic": debate_rooms[room_key]["topic"]}
+
+def _waiting_status(ticket: Ticket) -> dict:
+    return {
+        "status": "waiting",
+        "genre": ticket.genre,
+        "rating_band": ticket.band,
+        "band_reach": ticket.reach(),
+        "queued": len(matchmaking)
+    }
+
+@app.post("/matchmaking/{player_name}")
+async def join_matchmaking(
+    player_name: str,
+    genre: str = Query(..., description="Genre to debate in"),
+    topic: str = Query(None, description="Only match players who picked this topic")
+):
+    """Queue for a debate against a player of similar rating"""
+    if genre.lower() not in VALID_GENRES:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "Invalid genre", "valid_genres": VALID_GENRES}
+        )
+
+    player = await player_service.get_player(player_name)
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not found")
+
+    pair = matchmaking.enqueue(player_name, player.rating, genre, topic)
+    if pair is None:
+        return _waiting_status(matchmaking.ticket(player_name))
+    await _start_matched_debate(*pair)
+    return _match_status(player_name)
+
+@app.get("/matchmaking/{player_name}")
+async def get_matchmaking_status(player_name: str):
+    """Poll for a match; each poll widens the rating band the longer the player has waited"""
+    if player_name in matchmaking.matched:
+        return _match_status(player_name)
+
+    if matchmaking.ticket(player_name) is None:
+        raise HTTPException(status_code=404, detail="Player is not in the matchmaking queue")
+
+    pair = matchmaking.retry(player_name)
+    if pair is None:
+        return _waiting_status(matchmaking.ticket(player_name))
+    await _start_matched_debate(*pair)
+    return _match_status(player_name)
+
+@app.delete("/matchmaking/{player_name}")
+async def leave_matchmaking(player_name: str):
+    """Leave the matchmaking queue"""
+    if not matchmaking.leave(player_name):
+        raise HTTPException(status_code=404, detail="Player is not in the matchmaking queue")
+    return {"status": "left", "player": player_name}
+
+def _turn_room(room_key: str, player_name: str) -> dict:
+    """The room a player is submitting to, if it is that player's turn"""
     if room_key not in debate_rooms:
         raise HTTPException(status_code=404, detail="Room not found")
 
@@ -209,77 +473,284 @@ async def submit_argument(room_key: str, player_name: str, argument: Argument):
     if player_name != room["current_turn"]:
         raise HTTPException(status_code=400, detail="Not your turn")
 
-    room["arguments"][player_name].append(argument.argument)
+    return room
+
+def _completes_round(room: dict, player_name: str) -> bool:
+    """Whether this player's next argument closes a round, i.e. the submission gets scored"""
+    opponent = room["player2_name"] if player_name == room["player1_name"] else room["player1_name"]
+    submitted = len(room["arguments"][player_name]) + 1
+    return submitted == len(room["arguments"].get(opponent, [])) and submitted <= 5
+
+async def _admit_submission(room_key: str, player_name: str) -> Optional[float]:
+    """
+    Take an LLM admission slot for a submission that will be scored. Arguments
+    that only open a round, and submissions rejected outright, don't call
+    Gemini, so they aren't held to the limit; returns None for those.
+    """
+    if not _completes_round(_turn_room(room_key, player_name), player_name):
+        return None
+    return await llm_admission.acquire(player_name)
+
+def _release_submission(player_name: str, admitted_at: Optional[float], handed_off: bool = False):
+    if admitted_at is None:
+        return
+    if handed_off:
+        # The slot stays busy until the late scoring finishes
+        llm_admission.detach(player_name)
+    else:
+        llm_admission.release(player_name, admitted_at)
+
+def _accept_argument(room_key: str, player_name: str, argument: str):
+    """
+    Validate and record a submitted argument, then switch turns.
+    Returns the room, the current round and, if this submission completed a
+    round (both players have argued), the number of the round to score.
+    """
+    room = _turn_room(room_key, player_name)
+
+    room["arguments"][player_name].append(argument)
   
     # Determine current round
     player1_arguments = room["arguments"][room["player1_name"]]
     player2_arguments = room["arguments"].get(room["player2_name"], [])
     current_round = min(len(player1_arguments), len(player2_arguments)) + (1 if player_name == room["player1_name"] else 0)
-    
-    round_result = None
-    if len(player1_arguments) == len(player2_arguments):
-        # Both players have submitted arguments for this round
-        if len(player1_arguments) <= 5:  # Process rounds 1-5
-            # Score the current round
-            p1_arg = player1_arguments[-1]
-            p2_arg = player2_arguments[-1]
-            round_result = {
-                "round": len(player1_arguments),
-                "player1": {
-                    "name": room["player1_name"],
-                    "argument": p1_arg
-                },
-                "player2": {
-                    "name": room["player2_name"],
-                    "argument": p2_arg
-                },
-                "scores": run_debate(
-                    topic=room["topic"],
-                    player1_name=room["player1_name"],
-                    player1_arguments=[p1_arg],
-                    player2_name=room["player2_name"],
-                    player2_arguments=[p2_arg],
-                    game_id=f"{room_key}_round_{len(player1_arguments)}"
-                )["rounds"][0]
-            }
-    
+
     # Switch turns
     room["current_turn"] = room["player2_name"] if player_name == room["player1_name"] else room["player1_name"]
 
-    #Check if debate is complete (5 rounds)
-    if len(player1_arguments) == 5 and len(player2_arguments) == 5:
-        result = run_debate(
+    scored_round = None
+    if len(player1_arguments) == len(player2_arguments) and len(player1_arguments) <= 5:
+        # Both players have submitted arguments for this round
+        scored_round = len(player1_arguments)
+
+    return room, current_round, scored_round
+
+def _round_arguments(room: dict, round_num: int):
+    return (room["arguments"][room["player1_name"]][round_num - 1],
+            room["arguments"][room["player2_name"]][round_num - 1])
+
+def _record_round(room: dict, round_num: int, scores: dict, provisional: bool = False) -> dict:
+    """
+    Attach a scored round to the room and return it in API form. A provisional
+    round holds heuristic scores until _settle_round replaces them.
+    """
+    p1_arg, p2_arg = _round_arguments(room, round_num)
+    round_result = {
+        "round": round_num,
+        "player1": {
+            "name": room["player1_name"],
+            "argument": p1_arg
+        },
+        "player2": {
+            "name": room["player2_name"],
+            "argument": p2_arg
+        },
+        "scores": scores,
+        "provisional": provisional
+    }
+    room["round_results"].append(round_result)
+    return round_result
+
+def _settle_round(room: dict, round_num: int, scores: Optional[dict]):
+    """Replace a provisional round's scores with the real ones (or keep them if scoring failed)"""
+    for round_result in room["round_results"]:
+        if round_result["round"] == round_num:
+            if scores is not None:
+                round_result["scores"] = scores
+            round_result["provisional"] = False
+
+def _debate_complete(room: dict) -> bool:
+    return len(room["arguments"][room["player1_name"]]) == 5 and \
+           len(room["arguments"].get(room["player2_name"], [])) == 5
+
+def _pending_rounds(room: dict) -> List[int]:
+    return [r["round"] for r in room["round_results"] if r.get("provisional")]
+
+async def _maybe_finalize(room_key: str, room: dict) -> Optional[dict]:
+    """
+    Finalize the debate once all 5 rounds have their real scores. While a
+    provisional round is still being reconciled the room waits in "scoring".
+    If finalizing fails the room is marked "failed" so clients stop waiting.
+    """
+    if not _debate_complete(room) or room["status"] not in ("in_progress", "scoring"):
+        return None
+    if len(room["round_results"]) < 5 or _pending_rounds(room):
+        if room["status"] != "scoring":
+            room["status"] = "scoring"
+            room_snapshots.commit(room_key, room)
+        return None
+    if room_key in finalizing_rooms:
+        return None
+    finalizing_rooms.add(room_key)
+    try:
+        return await _finalize_debate(room_key, room)
+    except Exception:
+        room["status"] = "failed"
+        room_snapshots.commit(room_key, room)
+        _room_ended(room_key)
+        raise
+    finally:
+        finalizing_rooms.discard(room_key)
+
+async def _score_round_by_deadline(room_key: str, room: dict, round_num: int, admitted_at: float):
+    """
+    Score a round, answering within ROUND_SCORING_DEADLINE. If Gemini is slower,
+    the round is recorded with heuristic scores and the real scoring carries on
+    in the background to replace them. Scoring runs without the 5/5/5 fallback,
+    so a Gemini failure leaves the heuristic scores in place instead of a tie.
+
+    Returns the round result and whether the caller's admission slot was handed
+    to the background reconciliation (which releases it when scoring ends).
+    """
+    p1_arg, p2_arg = _round_arguments(room, round_num)
+    with attribute(room_key=room_key):
+        scoring = asyncio.ensure_future(asyncio.to_thread(
+            score_round, p1_arg, p2_arg, room["topic"], round_num, room["player1_name"], room["player2_name"],
+            fallback=False))
+    return await _await_round_scores(room_key, room, round_num, scoring, admitted_at)
+
+async def _stream_round_by_deadline(room_key: str, room: dict, round_num: int, admitted_at: float,
+                                    events: asyncio.Queue):
+    """
+    Streaming counterpart of _score_round_by_deadline: forwards "partial" score
+    events to the client until the round is recorded, under the same deadline.
+    """
+    p1_arg, p2_arg = _round_arguments(room, round_num)
+    verdicts = stream_score_round(p1_arg, p2_arg, room["topic"], round_num, room["player1_name"],
+                                  room["player2_name"], fallback=False)
+
+    async def stream_scores():
+        async for event in iterate_in_threadpool(verdicts):
+            if event["type"] == "round":
+                return event["result"]
+            # Once a provisional round has been sent, late partial scores are of no use to the client
+            if not any(r["round"] == round_num for r in room["round_results"]):
+                await events.put(event)
+
+    with attribute(room_key=room_key):
+        scoring = asyncio.ensure_future(stream_scores())
+    return await _await_round_scores(room_key, room, round_num, scoring, admitted_at)
+
+async def _await_round_scores(room_key: str, room: dict, round_num: int, scoring: asyncio.Future,
+                              admitted_at: float):
+    """Wait up to ROUND_SCORING_DEADLINE for a round's scores (see _score_round_by_deadline)"""
+    p1_arg, p2_arg = _round_arguments(room, round_num)
+    try:
+        deadline = ROUND_SCORING_DEADLINE if ROUND_SCORING_DEADLINE > 0 else None
+        scores = await asyncio.wait_for(asyncio.shield(scoring), deadline)
+    except asyncio.TimeoutError:
+        print(f"[WARN] Round {round_num} of room {room_key} missed the scoring deadline; using a provisional score")
+        round_result = _record_round(room, round_num, provisional_round(p1_arg, p2_arg, room["topic"], round_num),
+                                     provisional=True)
+        task = asyncio.create_task(_reconcile_round(room_key, room, round_num, scoring, admitted_at))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        return round_result, True
+    except Exception as e:
+        print(f"[ERROR] Scoring failed for round {round_num} of room {room_key}, using the heuristic score: {e}")
+        scores = provisional_round(p1_arg, p2_arg, room["topic"], round_num)
+    return _record_round(room, round_num, scores), False
+
+async def _reconcile_round(room_key: str, room: dict, round_num: int, scoring: asyncio.Future, admitted_at: float):
+    """
+    Swap in a round's late real scores, publish the change and finalize if this
+    was the last one. Holds the submit request's admission slot until the
+    scoring thread is done, so late Gemini calls still count against the limit.
+    """
+    try:
+        scores = await scoring
+    except Exception as e:
+        print(f"[ERROR] Late scoring failed for round {round_num} of room {room_key}, keeping the provisional score: {e}")
+        scores = None
+    finally:
+        llm_admission.release(None, admitted_at)
+    if room["status"] == "aborted":
+        return
+    _settle_round(room, round_num, scores)
+    room_snapshots.commit(room_key, room)
+    try:
+        if await _maybe_finalize(room_key, room) is not None:
+            room_snapshots.commit(room_key, room)
+    except Exception as e:
+        print(f"[ERROR] Could not finalize room {room_key}: {e}")
+
+async def _finalize_debate(room_key: str, room: dict) -> dict:
+    """Decide the winner from the scored rounds, update players and archive the debate"""
+    with attribute(room_key=room_key):
+        result = await asyncio.to_thread(
+            run_debate,
             topic=room["topic"],
             player1_name=room["player1_name"],
-            player1_arguments=player1_arguments,
+            player1_arguments=room["arguments"][room["player1_name"]],
             player2_name=room["player2_name"],
-            player2_arguments=player2_arguments,
-            game_id=room_key
+            player2_arguments=room["arguments"][room["player2_name"]],
+            game_id=room_key,
+            rounds=[r["scores"] for r in room["round_results"]]
         )
 
-        winner = result["winner"]
+    # Archive before rating: a ratings replay that misses this debate must see
+    # the players' rating updates as newer than its snapshot
+    result["genre"] = room.get("genre")
+    storage.put_json(minio_client, MINIO_BUCKET, "debate", room_key, result)
+
+    winner = result["winner"]
+    if winner == "Tie":
+        await player_service.update_scores(
+            room["player1_name"], room["player2_name"],
+            result["players"]["player1"]["rounds_won"], result["players"]["player2"]["rounds_won"],
+            draw=True
+        )
+    else:
         loser = room["player2_name"] if winner == room["player1_name"] else room["player1_name"]
         winner_score = result["players"]["player1" if winner == room["player1_name"] else "player2"]["rounds_won"]
         loser_score = result["players"]["player1" if loser == room["player1_name"] else "player2"]["rounds_won"]
 
         await player_service.update_scores(winner, loser, winner_score, loser_score)
 
-        debate_data = json.dumps(result).encode('utf-8')
-        minio_client.put_object(
-            MINIO_BUCKET,
-            f"debate_{room_key}.json",
-            BytesIO(debate_data),
-            length=len(debate_data)
-        )
+    await asyncio.to_thread(analytics.record_debate, result)
+
+    room["status"] = "completed"
+    _room_ended(room_key)
+    return result
 
-        room["status"] = "completed"
+#Submit arguments for each round
+@app.post("/submit-argument/{room_key}/{player_name}")
+async def submit_argument(room_key: str, player_name: str, argument: Argument):
+    """Submit an argument for the current round"""
+    admitted_at = await _admit_submission(room_key, player_name)
+    handed_off = False
+    try:
+        room, current_round, scored_round = _accept_argument(room_key, player_name, argument.argument)
+        # Publish the argument and turn switch now; scoring can take up to the deadline
+        room_snapshots.commit(room_key, room, player_name, argument.argument)
+
+        round_result = None
+        if scored_round is not None:
+            # Score the current round
+            round_result, handed_off = await _score_round_by_deadline(room_key, room, scored_round, admitted_at)
+            room_snapshots.commit(room_key, room)
+
+        #Check if debate is complete (5 rounds)
+        result = await _maybe_finalize(room_key, room)
+        if result is not None:
+            room_snapshots.commit(room_key, room)
+            return {
+                "status": "completed", 
+                "current_round": current_round,
+                "round_result": round_result,
+                "final_result": result
+            }
+    finally:
+        _release_submission(player_name, admitted_at, handed_off)
+
+    if room["status"] == "scoring":
+        # The final result follows on /room-events (or /room-status) once late scores are in
         return {
-            "status": "completed", 
+            "status": "scoring",
             "current_round": current_round,
             "round_result": round_result,
-            "final_result": result
+            "pending_rounds": _pending_rounds(room)
         }
-
     return {
         "status": "in_progress",
         "current_round": current_round,
@@ -287,6 +758,64 @@ async def submit_argument(room_key: str, player_name: str, argument: Argument):
         "next_turn": room["current_turn"]
     }
 
+@app.post("/submit-argument/{room_key}/{player_name}/stream")
+async def submit_argument_stream(room_key: str, player_name: str, argument: Argument):
+    """
+    Submit an argument and stream the round verdict as newline-delimited JSON:
+    an "accepted" event, "partial" events as each score is read from the model,
+    a "round" event with the full round result and, after round 5, "completed".
+    The round is subject to ROUND_SCORING_DEADLINE like /submit-argument.
+    """
+    admitted_at = await _admit_submission(room_key, player_name)
+    try:
+        room, current_round, scored_round = _accept_argument(room_key, player_name, argument.argument)
+    except BaseException:
+        _release_submission(player_name, admitted_at)
+        raise
+    room_snapshots.commit(room_key, room, player_name, argument.argument)
+
+    events: asyncio.Queue = asyncio.Queue()
+    await events.put({
+        "type": "accepted",
+        "status": room["status"],
+        "current_round": current_round,
+        "next_turn": room["current_turn"]
+    })
+
+    # Scoring runs as its own task so a client disconnecting mid-stream can't
+    # leave the round unscored or the debate unfinalized
+    async def score():
+        handed_off = False
+        try:
+            if scored_round is not None:
+                round_result, handed_off = await _stream_round_by_deadline(room_key, room, scored_round,
+                                                                           admitted_at, events)
+                room_snapshots.commit(room_key, room)
+                await events.put({"type": "round", "round_result": round_result})
+
+            result = await _maybe_finalize(room_key, room)
+            if result is not None:
+                room_snapshots.commit(room_key, room)
+                await events.put({"type": "completed", "status": "completed", "final_result": result})
+            elif room["status"] == "scoring":
+                await events.put({"type": "scoring", "status": "scoring", "pending_rounds": _pending_rounds(room)})
+        except Exception as e:
+            print(f"Error scoring round for room {room_key}: {e}")
+            await events.put({"type": "error", "detail": str(e)})
+        finally:
+            _release_submission(player_name, admitted_at, handed_off)
+            await events.put(None)
+
+    task = asyncio.create_task(score())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+    async def stream():
+        while (event := await events.get()) is not None:
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.post("/abort-debate/{room_key}/{player_name}")
 async def abort_debate(room_key: str, player_name: str):
     """Allow a player to abort a debate with a score penalty"""
@@ -303,12 +832,32 @@ async def abort_debate(room_key: str, player_name: str):
     if room["status"] != "in_progress":
         raise HTTPException(status_code=400, detail="Debate is not in progress")
     
+    opponent = room["player2_name"] if player_name == room["player1_name"] else room["player1_name"]
+
+    # Archive the abort so rating replays can count it as a forfeit (before
+    # the rating update, see _finalize_debate)
+    abort_record = {
+        "game_id": room_key,
+        "status": "aborted",
+        "topic": room["topic"],
+        "genre": room.get("genre"),
+        "aborted_by": player_name,
+        "opponent": opponent,
+        "rounds_played": len(room["round_results"]),
+        "timestamp": str(datetime.datetime.utcnow())
+    }
+    storage.put_json(minio_client, MINIO_BUCKET, "abort", room_key, abort_record)
+
     # Apply penalty to the player who aborted
-    await player_service.apply_abort_penalty(player_name)
+    await player_service.apply_abort_penalty(player_name, opponent)
     
     # Update room status
     room["status"] = "aborted"
     room["aborted_by"] = player_name
+    room_snapshots.commit(room_key, room)
+    _room_ended(room_key)
+
+    await asyncio.to_thread(analytics.record_abort, abort_record)
     
     return {
         "status": "aborted",
@@ -319,24 +868,241 @@ async def abort_debate(room_key: str, player_name: str):
 
 # Get current room status
 @app.get("/room-status/{room_key}")
-async def get_room_status(room_key: str):
+async def get_room_status(
+    room_key: str,
+    if_none_match: str = Header(None),
+    since_version: int = Query(None, description="Only return changes after this room version")
+):
     """Get the current status of a debate room"""
     if room_key not in debate_rooms:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    
     room = debate_rooms[room_key]
-    # @souze - i dont know if this is logic is ok or not
-    # get all arguments in One Array in entry sequence {one by one , p1,p2}
-# [ {player:p1, arg:" "}, {player:p2, arg:""} ,{player:p1, arg:" "}, {player:p2, arg:""}]
-    all_arguments = []
-    for i in range(max(len(room["arguments"][room["player1_name"]]), len(room["arguments"].get(room["player2_name"], [])))):
-        if i < len(room["arguments"][room["player1_name"]]):
-            all_arguments.append({"player": room["player1_name"], "argument": room["arguments"][room["player1_name"]][i]})
-        if i < len(room["arguments"].get(room["player2_name"], [])):
-            all_arguments.append({"player": room["player2_name"], "argument": room["arguments"][room["player2_name"]][i]})
-    
-    return {"room": room, "all_arguments": all_arguments}
+    # Arguments are kept in entry sequence {one by one , p1,p2} by room_snapshots.commit
+    # [ {player:p1, arg:" "}, {player:p2, arg:""} ,{player:p1, arg:" "}, {player:p2, arg:""}]
+    etag = room_snapshots.etag(room_key, room)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if room_snapshots.matches(if_none_match, etag) or \
+       (since_version is not None and since_version >= room["version"]):
+        return Response(status_code=304, headers=headers)
+
+    if since_version is not None:
+        body = room_snapshots.delta_body(room_key, room, since_version)
+    else:
+        body = room_snapshots.full_body(room_key, room)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Batch reads
+class BatchReads:
+    """Lookups shared by the operations of one batch; each runs once however many operations need it"""
+
+    def __init__(self):
+        self._tasks: dict = {}
+
+    def get(self, key: tuple, fn, *args) -> asyncio.Future:
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(fn(*args))
+        return self._tasks[key]
+
+def _require(op: BatchOperation, *fields: str):
+    missing = [field for field in fields if getattr(op, field) is None]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"'{op.op}' requires: {', '.join(missing)}")
+
+async def _batch_player(op: BatchOperation, reads: BatchReads):
+    _require(op, "username")
+    player = await reads.get(("player", op.username), player_service.get_player, op.username)
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not found")
+    return player
+
+async def _batch_room(op: BatchOperation, reads: BatchReads):
+    _require(op, "room_key")
+    room = debate_rooms.get(op.room_key)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if op.since_version is not None:
+        if op.since_version >= room["version"]:
+            return {"version": room["version"], "not_modified": True}
+        return codec.loads(room_snapshots.delta_body(op.room_key, room, op.since_version))
+    return codec.loads(room_snapshots.full_body(op.room_key, room))
+
+async def _batch_history(op: BatchOperation, reads: BatchReads):
+    """One page of a player's debates, newest first"""
+    await _batch_player(op, reads)
+    history = await reads.get(("history", op.username), player_service.get_debate_history, op.username)
+    ordered = sorted(history, key=lambda debate: str(debate.get("timestamp", "")), reverse=True)
+    return {
+        "total": len(ordered),
+        "offset": op.offset,
+        "limit": op.limit,
+        "debates": ordered[op.offset:op.offset + op.limit]
+    }
+
+async def _batch_genres(op: BatchOperation, reads: BatchReads):
+    return {"genres": VALID_GENRES}
+
+async def _batch_topics(op: BatchOperation, reads: BatchReads):
+    _require(op, "genre")
+    return await reads.get(("topics", op.genre.lower()), admitted_topics, op.genre)
+
+async def _batch_leaderboard_position(op: BatchOperation, reads: BatchReads):
+    _require(op, "username")
+    all_players = await reads.get(("all_players",), player_service.get_all_players)
+    rank = _player_rank(all_players, op.username)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Player not found")
+    return {"rank": rank, "total_players": len(all_players)}
+
+BATCH_OPERATIONS = {
+    "player": _batch_player,
+    "room": _batch_room,
+    "history": _batch_history,
+    "genres": _batch_genres,
+    "topics": _batch_topics,
+    "leaderboard_position": _batch_leaderboard_position
+}
+
+@app.post("/batch")
+async def batch_read(batch: BatchRequest):
+    """
+    Run several read operations concurrently and return their results in order.
+    Each result has its own status, so one failed operation doesn't fail the batch.
+    """
+    reads = BatchReads()
+
+    async def run(op: BatchOperation) -> dict:
+        result = {"id": op.id, "op": op.op}
+        try:
+            return {**result, "status": 200, "data": await BATCH_OPERATIONS[op.op](op, reads)}
+        except (HTTPException, AdmissionRejected) as e:
+            return {**result, "status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            print(f"[ERROR] Batch operation {op.op} failed: {e}")
+            return {**result, "status": 500, "detail": str(e)}
+
+    with span("batch", operations=len(batch.operations)):
+        results = await asyncio.gather(*(run(op) for op in batch.operations))
+    return {"results": results}
+
+# Push room changes as server-sent events
+@app.get("/room-events/{room_key}")
+async def room_events(
+    room_key: str,
+    request: Request,
+    since_version: int = Query(None, description="Only send changes after this room version"),
+    last_event_id: str = Header(None)
+):
+    """
+    Stream the room as server-sent events: the full room first (or only what
+    changed since since_version / Last-Event-ID), then a delta every time the
+    room's version changes, e.g. when a provisional round score is replaced.
+    The stream ends once the debate is completed or aborted.
+    """
+    if room_key not in debate_rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if since_version is None and last_event_id and last_event_id.isdigit():
+        since_version = int(last_event_id)
+
+    async def events():
+        version = since_version
+        while True:
+            room = debate_rooms.get(room_key)
+            if room is None:
+                return
+            if version is None or room["version"] > version:
+                if version is None:
+                    body = room_snapshots.full_body(room_key, room)
+                else:
+                    body = room_snapshots.delta_body(room_key, room, version)
+                version = room["version"]
+                yield f"id: {version}\nevent: room\ndata: {body.decode('utf-8')}\n\n"
+                if room["status"] in ("completed", "aborted", "failed"):
+                    return
+            elif await request.is_disconnected():
+                return
+            elif not await room_snapshots.wait_for_change(room_key, room, version, ROOM_EVENTS_KEEPALIVE):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.on_event("startup")
+async def start_analytics_folds():
+    """Fold the analytics journal from a background task, never inside a request"""
+    task = asyncio.create_task(_fold_analytics())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def _fold_analytics():
+    while True:
+        await asyncio.sleep(ANALYTICS_FOLD_SECONDS)
+        if analytics.pending():
+            await asyncio.to_thread(analytics.save)
+
+@app.on_event("shutdown")
+async def save_caches():
+    """Persist in-memory indexes before the worker exits"""
+    await asyncio.to_thread(SCORE_CACHE.save)
+    await asyncio.to_thread(analytics.save)
+    await asyncio.to_thread(tracing.exporter.flush)
+
+# Admin: runtime metrics
+@app.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    """Get runtime counters for the API"""
+    return {
+        "single_flight": singleflight.stats(),
+        "admission": llm_admission.stats(),
+        "score_cache": SCORE_CACHE.stats(),
+        "lobby": {"waiting_rooms": len(lobby), **matchmaking.stats()},
+        "analytics": analytics.stats()
+    }
+
+# Admin: LLM token spend
+@app.get("/admin/tokens", dependencies=[Depends(require_admin)])
+async def get_token_usage():
+    """Get overall Gemini token spend, by call kind, plus the most recent calls"""
+    return ledger.summary()
+
+@app.get("/admin/tokens/rooms/{room_key}", dependencies=[Depends(require_admin)])
+async def get_room_token_usage(room_key: str):
+    """Get Gemini token spend for one debate room"""
+    usage = ledger.for_room(room_key)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No token usage recorded for this room")
+    return {"room_key": room_key, "usage": usage}
+
+@app.get("/admin/tokens/players/{username}", dependencies=[Depends(require_admin)])
+async def get_player_token_usage(username: str):
+    """Get Gemini token spend for scoring one player's arguments"""
+    usage = ledger.for_player(username)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No token usage recorded for this player")
+    return {"username": username, "usage": usage}
+
+# Admin: rating replay
+@app.post("/admin/ratings/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_ratings():
+    """Replay the full debate archive and publish a new ratings snapshot"""
+    return await asyncio.to_thread(player_service.ratings.rebuild)
+
+# Admin: analytics rollup rebuild
+@app.post("/admin/stats/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_stats():
+    """Recompute the analytics rollup from the full debate archive"""
+    return await asyncio.to_thread(analytics.rebuild)
+
+# Admin: sampling profiler switch
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling():
+    """Get the current profiling configuration"""
+    return tracing.profiling.status()
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+async def set_profiling(config: ProfilingConfig):
+    """Turn on the sampling profiler for a fraction of requests"""
+    tracing.profiling.configure(config.enabled, config.sample_rate)
+    return tracing.profiling.status()
 
 if __name__ == "__main__":
     print("Starting FastAPI server...")
@@ -0,0 +1,100 @@
+"""
+Copy flat-layout objects (player_alice.json, debate_ABC123.json, ...) to the
+hash-sharded layout (players/3f/alice.json, ...).
+
+Cutover:
+    1. deploy with STORAGE_LAYOUT=dual (new writes go to sharded keys,
+       reads fall back to legacy keys)
+    2. python migrate_storage.py
+    3. python migrate_storage.py --delete-legacy
+    4. redeploy with STORAGE_LAYOUT=sharded
+
+The migration is idempotent: an object whose sharded copy already exists is
+skipped, so it is safe to re-run after a failure. A sharded copy is never
+overwritten, since in dual mode it may be newer than the legacy object: each
+copy is a conditional create (storage.create_object), so a record the app
+writes while the migration runs wins even if it lands between our read and
+our write. This needs a MinIO release that supports conditional writes.
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+
+from minio import Minio
+
+import storage
+
+
+def migrate_object(client: Minio, bucket: str, kind: str, name: str, legacy: str,
+                   delete_legacy: bool, dry_run: bool) -> str:
+    target = storage.sharded_key(kind, name)
+    if dry_run:
+        try:
+            client.stat_object(bucket, target)
+            outcome = "skipped"
+        except Exception:
+            return "would_copy"
+    else:
+        data = client.get_object(bucket, legacy).read()
+        # Only creates the sharded key if nothing (e.g. a dual-mode write) got there first
+        outcome = "copied" if storage.create_object(client, bucket, target, data) else "skipped"
+
+    if delete_legacy:
+        if dry_run:
+            return "would_delete"
+        client.remove_object(bucket, legacy)
+        return "deleted"
+    return outcome
+
+
+def migrate(client: Minio, bucket: str, kinds, workers: int = storage.STORAGE_WORKERS,
+            delete_legacy: bool = False, dry_run: bool = False) -> dict:
+    report = {}
+    for kind in kinds:
+        objects = storage.legacy_objects(client, bucket, kind)
+        counts = Counter()
+
+        def one(entry):
+            name, legacy = entry
+            try:
+                return migrate_object(client, bucket, kind, name, legacy, delete_legacy, dry_run)
+            except Exception as e:
+                print(f"[ERROR] {legacy}: {e}")
+                return "failed"
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            counts.update(pool.map(one, objects))
+        report[kind] = {"legacy_objects": len(objects), **counts}
+        print(f"[INFO] {kind}: {report[kind]}")
+    return report
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Migrate MinIO objects to the sharded key layout")
+    parser.add_argument("--kinds", type=lambda s: s.split(","), default=list(storage.KINDS),
+                        help="comma-separated record kinds (default: all)")
+    parser.add_argument("--workers", type=int, default=storage.STORAGE_WORKERS, help="concurrent copies")
+    parser.add_argument("--delete-legacy", action="store_true",
+                        help="remove legacy objects once their sharded copy is in place")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+
+    unknown = [kind for kind in args.kinds if kind not in storage.KINDS]
+    if unknown:
+        parser.error(f"unknown kinds: {', '.join(unknown)}")
+
+    load_dotenv()
+    client = Minio(
+        os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+        access_key=os.getenv("MINIO_ACCESS_KEY"),
+        secret_key=os.getenv("MINIO_SECRET_KEY"),
+        secure=False
+    )
+    report = migrate(client, "debate-history", args.kinds, args.workers, args.delete_legacy, args.dry_run)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if any(counts.get("failed") for counts in report.values()) else 0)
@@ -1,6 +1,6 @@
 # models.py
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Literal
 from datetime import datetime
 
 
@@ -10,7 +10,12 @@ class Player(BaseModel):
     games_played: int = 0
     wins: int = 0
     losses: int = 0
-    created_at: datetime = datetime.now()
+    rating: float = 1500.0
+    # Ratings snapshot this rating was computed in (see rating.RatingBook)
+    rating_epoch: int = 0
+    # When the rating last changed incrementally (UTC); None if never
+    rated_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.now)
 
     class Config:
         json_encoders = {
@@ -21,14 +26,17 @@ class Player(BaseModel):
 class Room(BaseModel):
     room_key: str
     topic: str
+    genre: Optional[str] = None
     player1_name: str
     player2_name: Optional[str] = None
     current_round: int = 1
-    status: str = "waiting"  # waiting, pending_acceptance, in_progress, completed
+    status: str = "waiting"  # waiting, pending_acceptance, in_progress, scoring, completed, aborted, failed
     arguments: Dict[str, List[str]] = {}
     current_turn: Optional[str] = None
-    created_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
     invitation_accepted: bool = False
+    version: int = 0
+    round_results: List[dict] = []
 
 
 class JoinRoom(BaseModel):
@@ -40,3 +48,23 @@ class TopicResponse(BaseModel):
 
 class Argument(BaseModel):
     argument: str
+
+class ProfilingConfig(BaseModel):
+    enabled: bool
+    sample_rate: float = Field(0.01, ge=0.0, le=1.0)
+
+
+class BatchOperation(BaseModel):
+    # Echoed back so clients can match results to operations
+    id: Optional[str] = None
+    op: Literal["player", "room", "history", "genres", "topics", "leaderboard_position"]
+    username: Optional[str] = None
+    room_key: Optional[str] = None
+    genre: Optional[str] = None
+    since_version: Optional[int] = None
+    offset: int = Field(0, ge=0)
+    limit: int = Field(10, ge=1, le=50)
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=25)
@@ -1,109 +1,170 @@
-import json
-from typing import Optional, List
+import asyncio
+from collections import Counter
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, List
 from models import Player
 from minio import Minio
 from fastapi import HTTPException
-from io import BytesIO
+from tracing import traced
+from singleflight import single_flight
+from rating import RatingBook, elo_update
+import storage
+import codec
 
 
 class PlayerService:
     def __init__(self, minio_client: Minio, bucket_name: str):
         self.minio_client = minio_client
         self.bucket_name = bucket_name
-
+        self.ratings = RatingBook(minio_client, bucket_name)
+        # Per-player locks for read-modify-write, dropped once nobody holds or awaits them
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Counter = Counter()
+
+    @asynccontextmanager
+    async def _locked(self, *usernames: Optional[str]):
+        """Serialize updates to these players (locks are taken in sorted order so two updates can't deadlock)"""
+        names = sorted({username for username in usernames if username})
+        for username in names:
+            self._lock_users[username] += 1
+            self._locks.setdefault(username, asyncio.Lock())
+        held = []
+        try:
+            for username in names:
+                await self._locks[username].acquire()
+                held.append(username)
+            yield
+        finally:
+            for username in reversed(held):
+                self._locks[username].release()
+            for username in names:
+                self._lock_users[username] -= 1
+                if self._lock_users[username] <= 0:
+                    del self._lock_users[username]
+                    del self._locks[username]
+
+    async def _read_for_update(self, username: str) -> Optional[Player]:
+        # Not coalesced: a shared in-flight read may predate the last write
+        return await asyncio.to_thread(self._read_player, username)
+
+    @traced("PlayerService.get_player")
+    @single_flight("PlayerService.get_player", clone=lambda p: p.model_copy() if p else p)
     async def get_player(self, username: str) -> Optional[Player]:
         """Get a player by username"""
+        return await asyncio.to_thread(self._read_player, username)
+
+    def _read_player(self, username: str) -> Optional[Player]:
         try:
-            response = self.minio_client.get_object(
-                self.bucket_name,
-                f"player_{username}.json"
-            )
-            data = response.read()  # Properly read the MinIO response
-            player_data = json.loads(data.decode('utf-8'))
-            return Player(**player_data)
+            data = storage.get_bytes(self.minio_client, self.bucket_name, "player", username)
+            if data is None:
+                return None
+            return self.ratings.overlay(codec.decode_player(data))
         except Exception as e:
             return None
 
     async def create_player(self, username: str) -> Player:
         """Create a new player"""
-        if await self.get_player(username):
-            raise HTTPException(
-                status_code=400, detail="Username already exists")
+        async with self._locked(username):
+            if await self._read_for_update(username):
+                raise HTTPException(
+                    status_code=400, detail="Username already exists")
 
-        player = Player(username=username)
-        await self.save_player(player)
+            player = Player(username=username)
+            await self.save_player(player)
         return player
 
     async def save_player(self, player: Player):
         """Save player data to MinIO"""
-        player_data = player.model_dump_json().encode('utf-8')
-        self.minio_client.put_object(
-            self.bucket_name,
-            f"player_{player.username}.json",
-            BytesIO(player_data),  # Wrap in BytesIO
-            length=len(player_data)
-        )
-
-    async def apply_abort_penalty(self, username: str) -> Player:
-        """Apply a -30 penalty to a player's score for aborting a debate"""
-        player = await self.get_player(username)
-        if not player:
-            raise HTTPException(status_code=404, detail="Player not found")
-
-        # Apply -30 penalty
-        player.total_score = max(0, player.total_score - 30)  # Prevent negative scores
-        player.games_played += 1
-
-        # Save the updated player data
-        await self.save_player(player)
+        storage.put_bytes(self.minio_client, self.bucket_name, "player", player.username, codec.encode_player(player))
+
+    @traced("PlayerService.apply_abort_penalty")
+    async def apply_abort_penalty(self, username: str, opponent: Optional[str] = None) -> Player:
+        """
+        Apply a -30 penalty to a player's score for aborting a debate.
+        The abort also counts as a rated forfeit against the opponent, if any.
+        """
+        async with self._locked(username, opponent):
+            player = await self._read_for_update(username)
+            if not player:
+                raise HTTPException(status_code=404, detail="Player not found")
+
+            # Apply -30 penalty
+            player.total_score = max(0, player.total_score - 30)  # Prevent negative scores
+            player.games_played += 1
+
+            opponent_profile = await self._read_for_update(opponent) if opponent else None
+            if opponent_profile:
+                player.rating, opponent_profile.rating = elo_update(player.rating, opponent_profile.rating, 0.0)
+                player.rated_at = opponent_profile.rated_at = datetime.utcnow()
+                await self.save_player(opponent_profile)
+
+            # Save the updated player data
+            await self.save_player(player)
 
         return player
 
-    async def update_scores(self, winner: str, loser: str, winner_score: int, loser_score: int):
-        """Update player scores after a debate"""
-        winner_profile = await self.get_player(winner)
-        loser_profile = await self.get_player(loser)
+    @traced("PlayerService.update_scores")
+    async def update_scores(self, winner: str, loser: str, winner_score: int, loser_score: int, draw: bool = False):
+        """Update player scores and ratings after a debate (for a draw, winner/loser are just the two players)"""
+        async with self._locked(winner, loser):
+            winner_profile = await self._read_for_update(winner)
+            loser_profile = await self._read_for_update(loser)
 
-        if not winner_profile or not loser_profile:
-            raise HTTPException(status_code=404, detail="Player not found")
+            if not winner_profile or not loser_profile:
+                raise HTTPException(status_code=404, detail="Player not found")
 
-        score_diff = abs(winner_score - loser_score)
+            winner_profile.rating, loser_profile.rating = elo_update(
+                winner_profile.rating, loser_profile.rating, 0.5 if draw else 1.0)
+            winner_profile.rated_at = loser_profile.rated_at = datetime.utcnow()
+            winner_profile.games_played += 1
+            loser_profile.games_played += 1
 
-        winner_profile.total_score += score_diff
-        winner_profile.wins += 1
-        winner_profile.games_played += 1
+            if not draw:
+                score_diff = abs(winner_score - loser_score)
 
-        loser_profile.total_score -= score_diff
-        loser_profile.losses += 1
-        loser_profile.games_played += 1
+                winner_profile.total_score += score_diff
+                winner_profile.wins += 1
 
-        await self.save_player(winner_profile)
-        await self.save_player(loser_profile)
+                loser_profile.total_score -= score_diff
+                loser_profile.losses += 1
 
+            await self.save_player(winner_profile)
+            await self.save_player(loser_profile)
+
+    @traced("PlayerService.get_all_players")
+    @single_flight("PlayerService.get_all_players")
     async def get_all_players(self) -> List[Player]:
         """Get all players for ranking"""
-        players = []
+        return await asyncio.to_thread(self._load_all_players)
+
+    def _load_all_players(self) -> List[Player]:
+        def decode(data: bytes) -> Player:
+            return self.ratings.overlay(codec.decode_player(data))
+
         try:
-            # List all objects in the bucket with player_ prefix
-            objects = self.minio_client.list_objects(
-                self.bucket_name, 
-                prefix="player_", 
-                recursive=True
-            )
-            
-            for obj in objects:
-                try:
-                    response = self.minio_client.get_object(
-                        self.bucket_name, 
-                        obj.object_name
-                    )
-                    data = response.read()
-                    player_data = json.loads(data.decode('utf-8'))
-                    players.append(Player(**player_data))
-                except Exception as e:
-                    print(f"Error loading player data: {e}")
-                    continue
+            # Every player shard is listed and fetched concurrently
+            return storage.load_all(self.minio_client, self.bucket_name, "player", decode)
         except Exception as e:
             print(f"Error listing players: {e}")
-        
-        return players
\ No newline at end of file
+            return []
+
+    @traced("PlayerService.get_debate_history")
+    @single_flight("PlayerService.get_debate_history")
+    async def get_debate_history(self, username: str) -> List[dict]:
+        """Get every archived debate the player took part in"""
+        return await asyncio.to_thread(self._load_debate_history, username)
+
+    def _load_debate_history(self, username: str) -> List[dict]:
+        def decode(data: bytes) -> Optional[dict]:
+            data = codec.loads(data)
+            if data.get("players", {}).get("player1", {}).get("name") == username or \
+               data.get("players", {}).get("player2", {}).get("name") == username:
+                return data
+            return None
+
+        try:
+            return storage.load_all(self.minio_client, self.bucket_name, "debate", decode)
+        except Exception as e:
+            print(f"Error fetching debate history: {e}")
+            return []
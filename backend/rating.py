@@ -0,0 +1,273 @@
+"""
+Elo rating engine.
+
+Players' ratings are updated incrementally after every debate, and the whole
+archive of finished and aborted debates can be replayed from scratch to
+rebuild every rating (e.g. after changing ELO_K). A replay is published as a
+single snapshot object; player records older than the snapshot pick up their
+rating from it when they are next read, unless their rating changed after the
+replay started reading the archive.
+
+    python rating.py --rebuild          # replay the archive and publish a snapshot
+    python rating.py --benchmark 500000 # time a replay of synthetic matches
+"""
+import os
+import json
+import time
+import threading
+from io import BytesIO
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from minio import Minio
+
+import codec
+import storage
+from tracing import span
+
+INITIAL_RATING = float(os.getenv("INITIAL_RATING", "1500"))
+ELO_K = float(os.getenv("ELO_K", "32"))
+# How often a worker checks for a snapshot published by another worker
+RATING_SNAPSHOT_TTL = float(os.getenv("RATING_SNAPSHOT_TTL", "60"))
+RATING_POINTER_OBJECT = "ratings/current.json"
+ARCHIVE_KINDS = ("debate", "abort")
+
+
+def expected_score(rating_a, rating_b):
+    """Probability-like expected score of A against B (works on scalars and arrays)"""
+    return 1.0 / (1.0 + 10.0 ** ((rating_b - rating_a) / 400.0))
+
+
+def elo_update(rating_a: float, rating_b: float, score_a: float, k: float = ELO_K) -> Tuple[float, float]:
+    """Return the new ratings after A scores score_a (1 win, 0.5 draw, 0 loss) against B"""
+    delta = k * (score_a - expected_score(rating_a, rating_b))
+    return rating_a + delta, rating_b - delta
+
+
+class MatchArchive:
+    """Match outcomes as compact, chronologically sorted arrays"""
+
+    def __init__(self, names: List[str], player_a: np.ndarray, player_b: np.ndarray,
+                 score_a: np.ndarray, timestamps: np.ndarray):
+        order = np.argsort(timestamps, kind="stable")
+        self.names = names
+        self.player_a = player_a[order].astype(np.int32)
+        self.player_b = player_b[order].astype(np.int32)
+        self.score_a = score_a[order].astype(np.float64)
+        self.timestamps = timestamps[order].astype(np.float64)
+
+    def __len__(self):
+        return len(self.player_a)
+
+    @classmethod
+    def from_outcomes(cls, outcomes: List[Tuple[float, str, str, float]]) -> "MatchArchive":
+        """Build from (timestamp, player_a, player_b, score_a) tuples"""
+        index: Dict[str, int] = {}
+        a, b, s, t = [], [], [], []
+        for timestamp, name_a, name_b, score in outcomes:
+            a.append(index.setdefault(name_a, len(index)))
+            b.append(index.setdefault(name_b, len(index)))
+            s.append(score)
+            t.append(timestamp)
+        return cls(list(index), np.array(a), np.array(b), np.array(s), np.array(t))
+
+
+def _schedule(player_a: np.ndarray, player_b: np.ndarray, n_players: int) -> np.ndarray:
+    """
+    Assign every match to the earliest "layer" after all earlier matches of
+    both its players. Matches within a layer share no players, so a whole
+    layer can be updated at once, and each player's matches still apply in
+    chronological order.
+    """
+    next_free = [0] * n_players
+    layers = [0] * len(player_a)
+    for i, (a, b) in enumerate(zip(player_a.tolist(), player_b.tolist())):
+        layer = next_free[a] if next_free[a] > next_free[b] else next_free[b]
+        layers[i] = layer
+        next_free[a] = next_free[b] = layer + 1
+    return np.array(layers, dtype=np.int64)
+
+
+def replay(archive: MatchArchive, k: float = ELO_K) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """Recompute every rating from the full match history"""
+    n_players = len(archive.names)
+    ratings = np.full(n_players, INITIAL_RATING, dtype=np.float64)
+    games = np.zeros(n_players, dtype=np.int64)
+    if len(archive):
+        layers = _schedule(archive.player_a, archive.player_b, n_players)
+        order = np.argsort(layers, kind="stable")
+        boundaries = np.flatnonzero(np.diff(layers[order])) + 1
+        for batch in np.split(order, boundaries):
+            a = archive.player_a[batch]
+            b = archive.player_b[batch]
+            delta = k * (archive.score_a[batch] - expected_score(ratings[a], ratings[b]))
+            ratings[a] += delta
+            ratings[b] -= delta
+        games += np.bincount(archive.player_a, minlength=n_players)
+        games += np.bincount(archive.player_b, minlength=n_players)
+    return (
+        {name: round(float(r), 2) for name, r in zip(archive.names, ratings)},
+        {name: int(g) for name, g in zip(archive.names, games)}
+    )
+
+
+def _parse_timestamp(value) -> float:
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except Exception:
+        return 0.0
+
+
+def outcome_from_record(data: dict) -> Optional[Tuple[float, str, str, float]]:
+    """Turn an archived debate or abort record into a (timestamp, a, b, score_a) outcome"""
+    timestamp = _parse_timestamp(data.get("timestamp"))
+    if data.get("status") == "aborted":
+        # An abort is a forfeit: the player who left loses to their opponent
+        if not data.get("opponent"):
+            return None
+        return timestamp, data["aborted_by"], data["opponent"], 0.0
+
+    players = data.get("players", {})
+    p1 = players.get("player1", {}).get("name")
+    p2 = players.get("player2", {}).get("name")
+    if not p1 or not p2:
+        return None
+    winner = data.get("winner")
+    score = 1.0 if winner == p1 else 0.0 if winner == p2 else 0.5
+    return timestamp, p1, p2, score
+
+
+def load_match_archive(minio_client: Minio, bucket_name: str) -> MatchArchive:
+    """Read every finished and aborted debate from MinIO into a MatchArchive"""
+    def decode(data: bytes):
+        return outcome_from_record(codec.loads(data))
+
+    outcomes = []
+    for kind in ARCHIVE_KINDS:
+        outcomes.extend(storage.load_all(minio_client, bucket_name, kind, decode))
+    return MatchArchive.from_outcomes(outcomes)
+
+
+class RatingBook:
+    """
+    The latest published ratings snapshot. Player records carry the epoch
+    their rating was computed in; a record older than the snapshot takes the
+    snapshot's rating instead, so publishing never has to rewrite players.
+
+    A snapshot is as of the moment its replay started listing the archive.
+    Debates are archived before ratings are updated, so a record rated after
+    that moment may hold a result the replay never saw; it keeps its own rating.
+    """
+
+    def __init__(self, minio_client: Minio, bucket_name: str):
+        self.minio_client = minio_client
+        self.bucket_name = bucket_name
+        self.epoch = 0
+        self.as_of: Optional[datetime] = None
+        self.ratings: Dict[str, float] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        if not force and time.monotonic() - self._checked_at < RATING_SNAPSHOT_TTL:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                pointer = json.loads(self.minio_client.get_object(self.bucket_name, RATING_POINTER_OBJECT).read())
+                if pointer["epoch"] <= self.epoch:
+                    return
+                snapshot = json.loads(self.minio_client.get_object(self.bucket_name, pointer["object"]).read())
+            except Exception:
+                return
+            self.ratings = snapshot["ratings"]
+            self.epoch = snapshot["epoch"]
+            # Snapshots published before as_of was recorded are applied unconditionally
+            self.as_of = datetime.fromisoformat(snapshot["as_of"]) if snapshot.get("as_of") else None
+
+    def overlay(self, player):
+        """Bring a player's rating up to the current snapshot if it predates it"""
+        self.refresh()
+        if player.rating_epoch < self.epoch:
+            if player.rated_at is None or self.as_of is None or player.rated_at <= self.as_of:
+                player.rating = self.ratings.get(player.username, INITIAL_RATING)
+            player.rating_epoch = self.epoch
+        return player
+
+    def publish(self, ratings: Dict[str, float], games: Dict[str, int], matches: int, as_of: datetime) -> int:
+        """Write a replay's ratings as one snapshot object and point readers at it"""
+        self.refresh(force=True)
+        epoch = self.epoch + 1
+        object_name = f"ratings/snapshot_{epoch:06d}.json"
+        snapshot = json.dumps({
+            "epoch": epoch,
+            "generated_at": datetime.utcnow().isoformat(),
+            "as_of": as_of.isoformat(),
+            "k": ELO_K,
+            "matches": matches,
+            "ratings": ratings,
+            "games": games
+        }).encode('utf-8')
+        pointer = json.dumps({"epoch": epoch, "object": object_name}).encode('utf-8')
+        with span("minio.put_object", object_name=object_name):
+            self.minio_client.put_object(self.bucket_name, object_name, BytesIO(snapshot), length=len(snapshot))
+            self.minio_client.put_object(self.bucket_name, RATING_POINTER_OBJECT, BytesIO(pointer), length=len(pointer))
+        with self._lock:
+            self.ratings = ratings
+            self.epoch = epoch
+            self.as_of = as_of
+        return epoch
+
+    def rebuild(self) -> dict:
+        """Replay the full archive and publish the result"""
+        start = time.perf_counter()
+        as_of = datetime.utcnow()
+        with span("ratings.load_archive"):
+            archive = load_match_archive(self.minio_client, self.bucket_name)
+        loaded = time.perf_counter()
+        with span("ratings.replay", matches=len(archive)):
+            ratings, games = replay(archive)
+        replayed = time.perf_counter()
+        epoch = self.publish(ratings, games, len(archive), as_of)
+        return {
+            "epoch": epoch,
+            "players": len(ratings),
+            "matches": len(archive),
+            "load_seconds": round(loaded - start, 3),
+            "replay_seconds": round(replayed - loaded, 3),
+            "total_seconds": round(time.perf_counter() - start, 3)
+        }
+
+
+def _benchmark(matches: int, players: int = 20000):
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, players, matches)
+    b = (a + rng.integers(1, players, matches)) % players
+    archive = MatchArchive([f"p{i}" for i in range(players)], a, b,
+                           rng.choice([0.0, 0.5, 1.0], matches), np.arange(matches, dtype=np.float64))
+    start = time.perf_counter()
+    replay(archive)
+    print(f"Replayed {matches} matches between {players} players in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Rebuild Elo ratings from the debate archive")
+    parser.add_argument("--rebuild", action="store_true", help="replay the archive and publish a snapshot")
+    parser.add_argument("--benchmark", type=int, metavar="MATCHES", help="time a replay of synthetic matches")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.benchmark)
+    if args.rebuild:
+        load_dotenv()
+        client = Minio(
+            os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+            access_key=os.getenv("MINIO_ACCESS_KEY"),
+            secret_key=os.getenv("MINIO_SECRET_KEY"),
+            secure=False
+        )
+        print(json.dumps(RatingBook(client, "debate-history").rebuild(), indent=2))
@@ -0,0 +1,95 @@
+import json
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+
+
+def _encode(payload) -> bytes:
+    return json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+
+
+class RoomSnapshots:
+    """
+    Versioned, pre-serialized views of the in-memory debate rooms.
+
+    Every mutation of a room goes through commit(), which bumps room["version"]
+    and drops the cached body. The first /room-status poll after a change
+    serializes the room once; every later poll for the same version reuses
+    those bytes, so polling cost follows the rate of change, not the poll rate.
+    """
+
+    def __init__(self):
+        # room_key -> (version, serialized full body)
+        self._bodies: Dict[str, Tuple[int, bytes]] = {}
+        # room_key -> arguments in entry sequence and the version each one appeared in
+        self._arguments: Dict[str, List[dict]] = {}
+        self._argument_versions: Dict[str, List[int]] = {}
+        # room_key -> event set on the next commit, for /room-events subscribers
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    def _notify(self, room_key: str):
+        event = self._changed.pop(room_key, None)
+        if event is not None:
+            event.set()
+
+    def commit(self, room_key: str, room: dict, player_name: Optional[str] = None, argument: Optional[str] = None) -> int:
+        """Record a mutation of the room (optionally a newly submitted argument)"""
+        room["version"] = room.get("version", 0) + 1
+        if argument is not None:
+            self._arguments.setdefault(room_key, []).append({"player": player_name, "argument": argument})
+            self._argument_versions.setdefault(room_key, []).append(room["version"])
+        self._bodies.pop(room_key, None)
+        self._notify(room_key)
+        return room["version"]
+
+    def discard(self, room_key: str):
+        self._bodies.pop(room_key, None)
+        self._arguments.pop(room_key, None)
+        self._argument_versions.pop(room_key, None)
+        self._notify(room_key)
+
+    async def wait_for_change(self, room_key: str, room: dict, since_version: int, timeout: float) -> bool:
+        """Wait until the room moves past since_version; False if the timeout passed first"""
+        if room.get("version", 0) > since_version:
+            return True
+        event = self._changed.setdefault(room_key, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    @staticmethod
+    def etag(room_key: str, room: dict) -> str:
+        return f'"{room_key}-{room.get("version", 0)}"'
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], etag: str) -> bool:
+        """Check an If-None-Match header (possibly a list, possibly weak) against an ETag"""
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+    def full_body(self, room_key: str, room: dict) -> bytes:
+        version = room.get("version", 0)
+        cached = self._bodies.get(room_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        body = _encode({"room": room, "all_arguments": self._arguments.get(room_key, [])})
+        self._bodies[room_key] = (version, body)
+        return body
+
+    def delta_body(self, room_key: str, room: dict, since_version: int) -> bytes:
+        """Room fields plus only the arguments submitted after since_version"""
+        arguments = self._arguments.get(room_key, [])
+        versions = self._argument_versions.get(room_key, [])
+        start = len(versions)
+        while start > 0 and versions[start - 1] > since_version:
+            start -= 1
+        return _encode({
+            "version": room.get("version", 0),
+            "since_version": since_version,
+            "room": {key: value for key, value in room.items() if key != "arguments"},
+            "new_arguments": arguments[start:]
+        })
@@ -0,0 +1,201 @@
+import os
+import re
+import zlib
+import threading
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import numpy as np
+from minio import Minio
+
+from tracing import span
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity above which two arguments on the same topic share scores
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+# Persist to MinIO after this many new entries (and on shutdown)
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "50"))
+SEMANTIC_CACHE_OBJECT = "cache/semantic_scores.npz"
+
+EMBEDDING_DIM = 512
+LSH_BITS = 8
+LSH_SEED = 7
+CRITERIA = ("logic", "relevance", "persuasiveness")
+
+_word_pattern = re.compile(r"[a-z0-9']+")
+_negation_pattern = re.compile(r"\b(?:not|no|never|none|nobody|nothing|neither|nor|cannot|without)\b|n't\b")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_word_pattern.findall(text.lower()))
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Feature-hashed bag of words and character 3/4-grams, L2-normalised.
+    Cheap enough to run on every argument on CPU, and robust to the light
+    rewording, reordering and punctuation changes of copy-pasted arguments.
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    normalized = normalize(text)
+    features = normalized.split()
+    padded = f" {normalized} "
+    for n in (3, 4):
+        features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    for feature in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % EMBEDDING_DIM] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def negations(text: str) -> int:
+    """
+    Number of negation cues ("not", "never", "don't", ...). A rebuttal often
+    restates the other side's claim with a "not" added, which barely moves the
+    embedding, so arguments only share scores if their negations match too.
+    """
+    return len(_negation_pattern.findall(normalize(text)))
+
+
+class SemanticScoreCache:
+    """
+    Approximate nearest-neighbour cache of argument scores, partitioned by topic.
+
+    Vectors are bucketed with random-hyperplane LSH; a lookup probes the
+    argument's bucket and every bucket one bit away, then checks exact cosine
+    similarity against that handful of candidates. Buckets are also keyed by
+    the argument's negation count, so "X" and "not X" are never matched.
+    """
+
+    def __init__(self, minio_client: Minio, bucket_name: str, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.minio_client = minio_client
+        self.bucket_name = bucket_name
+        self.threshold = threshold
+        self._planes = np.random.default_rng(LSH_SEED).standard_normal((LSH_BITS, EMBEDDING_DIM)).astype(np.float32)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+        self.hits = 0
+        self.misses = 0
+
+    def _reset(self):
+        self._vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self._scores = np.zeros((0, len(CRITERIA)), dtype=np.float32)
+        self._topics: List[str] = []
+        self._negations: List[int] = []
+        self._count = 0
+        # (topic, negations, signature) -> entry ids
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._dirty = 0
+
+    def _signature(self, vector: np.ndarray) -> int:
+        bits = (self._planes @ vector) > 0
+        return int(np.dot(bits, 1 << np.arange(LSH_BITS)))
+
+    def _candidates(self, topic: str, negated: int, signature: int) -> List[int]:
+        ids = list(self._buckets.get((topic, negated, signature), ()))
+        for bit in range(LSH_BITS):
+            ids.extend(self._buckets.get((topic, negated, signature ^ (1 << bit)), ()))
+        return ids
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._loaded = True
+            self.load()
+
+    def lookup(self, topic: str, argument: str) -> Optional[dict]:
+        """Return cached scores for a near-duplicate argument on the same topic"""
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        with span("score_cache.lookup"), self._lock:
+            self._ensure_loaded()
+            topic = normalize(topic)
+            vector = embed(argument)
+            ids = self._candidates(topic, negations(argument), self._signature(vector))
+            if ids:
+                similarities = self._vectors[ids] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    return dict(zip(CRITERIA, (float(s) for s in self._scores[ids[best]])))
+            self.misses += 1
+            return None
+
+    def insert(self, topic: str, argument: str, scores: dict):
+        if not SEMANTIC_CACHE_ENABLED:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            if self._count >= SEMANTIC_CACHE_MAX_ENTRIES:
+                return
+            self._append(normalize(topic), negations(argument), embed(argument), [scores[c] for c in CRITERIA])
+            self._dirty += 1
+            should_save = self._dirty >= SEMANTIC_CACHE_SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def _append(self, topic: str, negated: int, vector: np.ndarray, scores):
+        if self._count == len(self._vectors):
+            capacity = max(1024, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (capacity, EMBEDDING_DIM))
+            self._scores = np.resize(self._scores, (capacity, len(CRITERIA)))
+        entry = self._count
+        self._vectors[entry] = vector
+        self._scores[entry] = scores
+        self._topics.append(topic)
+        self._negations.append(negated)
+        self._buckets.setdefault((topic, negated, self._signature(vector)), []).append(entry)
+        self._count += 1
+
+    def save(self):
+        """Persist the index to MinIO"""
+        with self._lock:
+            if not self._dirty:
+                return
+            buffer = BytesIO()
+            np.savez_compressed(
+                buffer,
+                dim=np.array(EMBEDDING_DIM),
+                vectors=self._vectors[:self._count],
+                scores=self._scores[:self._count],
+                topics=np.array(self._topics, dtype=str),
+                negations=np.array(self._negations, dtype=np.int32)
+            )
+            self._dirty = 0
+        try:
+            with span("minio.put_object", object_name=SEMANTIC_CACHE_OBJECT):
+                length = buffer.tell()
+                buffer.seek(0)
+                self.minio_client.put_object(self.bucket_name, SEMANTIC_CACHE_OBJECT, buffer, length=length)
+        except Exception as e:
+            print(f"[ERROR] Could not save semantic score cache: {e}")
+
+    def load(self):
+        """Load the persisted index from MinIO (called lazily on first use)"""
+        try:
+            response = self.minio_client.get_object(self.bucket_name, SEMANTIC_CACHE_OBJECT)
+            data = np.load(BytesIO(response.read()))
+        except Exception as e:
+            print(f"[INFO] No semantic score cache loaded: {e}")
+            return
+        if int(data["dim"]) != EMBEDDING_DIM:
+            print("[INFO] Ignoring semantic score cache with a different embedding size")
+            return
+        if "negations" not in data:
+            # Written before entries were keyed by negations; their polarity is unknown
+            print("[INFO] Ignoring semantic score cache without negation counts")
+            return
+        self._reset()
+        for topic, negated, vector, scores in zip(data["topics"], data["negations"], data["vectors"], data["scores"]):
+            self._append(str(topic), int(negated), vector, scores)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "entries": self._count,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses
+        }
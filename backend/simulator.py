@@ -0,0 +1,339 @@
+"""
+Headless bot-vs-bot debate simulator for capacity planning.
+
+Drives synthetic debates through the real FastAPI app in main.py (create
+players, fetch topics, create/join a room, submit 5 rounds each) in-process,
+at increasing concurrency levels, and reports rooms/s and LLM calls/s
+against request latency.
+
+    python simulator.py --debates 1000 --levels 1,4,16,64 --llm stub --storage memory
+    python simulator.py --debates 200 --levels 8 --llm real --output curves.json
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import random
+import asyncio
+import argparse
+import datetime
+import threading
+from io import BytesIO
+from types import SimpleNamespace
+from collections import Counter
+
+GENRES = ["sports", "cinema", "philosophy", "music", "geopolitics", "brainrot"]
+
+# Stock arguments players actually paste, reused across debates
+CORPUS = [
+    "Cereal is a soup because it is a liquid served in a bowl with solid pieces in it.",
+    "A hot dog is a sandwich since it is meat served inside split bread.",
+    "Pineapple on pizza balances salty and sweet, which is what good food does.",
+    "Esports demand the same discipline, training and reaction time as traditional sports.",
+    "College athletes generate billions and deserve a share of that revenue.",
+    "VAR removes obvious refereeing mistakes that used to decide whole tournaments.",
+    "Superhero movies crowd out original films at the box office and in studio budgets.",
+    "Free will is an illusion because every choice is caused by prior brain states.",
+    "Morality is objective because some acts are wrong regardless of culture.",
+    "Streaming pays artists fractions of a cent, so it hurts all but the biggest acts.",
+    "Nuclear weapons have prevented great-power wars for decades through deterrence.",
+    "Globalization lifted hundreds of millions out of poverty through trade.",
+]
+
+OPENERS = ["Clearly", "Historically", "In practice", "Statistically", "Morally", "Ultimately"]
+CLAIMS = ["the evidence favours my side", "the opposing view ignores key costs",
+          "most experts agree with this position", "the benefits outweigh the risks",
+          "this is consistent with how we treat similar cases", "the alternative leads to worse outcomes"]
+REASONS = ["because incentives matter", "since precedent supports it", "as the data from recent years shows",
+           "given how people actually behave", "because fairness requires it", "as every comparable system shows"]
+
+
+def generated_argument(rng: random.Random, round_num: int) -> str:
+    return f"{rng.choice(OPENERS)}, {rng.choice(CLAIMS)} {rng.choice(REASONS)} (point {round_num})."
+
+
+def _etag(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+class InMemoryMinio:
+    """Just enough of the MinIO client API for main.py to run without a MinIO server"""
+
+    def __init__(self, *args, **kwargs):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def bucket_exists(self, bucket_name):
+        return True
+
+    def make_bucket(self, bucket_name):
+        pass
+
+    def put_object(self, bucket_name, object_name, data, length, **kwargs):
+        with self._lock:
+            self._objects[object_name] = data.read(length) if length >= 0 else data.read()
+
+    def _put_object(self, bucket_name, object_name, data, headers=None, query_params=None):
+        # Only the conditional writes used by storage.create_object/replace_object
+        from minio.error import S3Error
+        headers = headers or {}
+        with self._lock:
+            current = self._objects.get(object_name)
+            if headers.get("If-None-Match") == "*" and current is not None or \
+                    "If-Match" in headers and (current is None or headers["If-Match"].strip('"') != _etag(current)):
+                raise S3Error(None, "PreconditionFailed", "At least one of the pre-conditions you specified did not hold",
+                              object_name, None, None)
+            self._objects[object_name] = bytes(data)
+
+    def fput_object(self, bucket_name, object_name, file_path, **kwargs):
+        with open(file_path, "rb") as file:
+            self.put_object(bucket_name, object_name, file, -1)
+
+    def get_object(self, bucket_name, object_name, **kwargs):
+        from minio.error import S3Error
+        with self._lock:
+            if object_name not in self._objects:
+                raise S3Error(None, "NoSuchKey", "Object does not exist", object_name, None, None)
+            return BytesIO(self._objects[object_name])
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        data = self.get_object(bucket_name, object_name).getvalue()
+        return SimpleNamespace(object_name=object_name, size=len(data), etag=_etag(data))
+
+    def remove_object(self, bucket_name, object_name, **kwargs):
+        with self._lock:
+            self._objects.pop(object_name, None)
+
+    def list_objects(self, bucket_name, prefix="", recursive=False, **kwargs):
+        with self._lock:
+            names = sorted(name for name in self._objects if name.startswith(prefix))
+        for name in names:
+            yield SimpleNamespace(object_name=name, size=len(self._objects.get(name, b"")),
+                                  last_modified=datetime.datetime.utcnow())
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+
+    def json(self):
+        return {"candidates": [{"content": {"parts": [{"text": self.text}]}}]}
+
+    def iter_lines(self, decode_unicode=True):
+        yield "data: " + json.dumps(self.json())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class StubRequests:
+    """Stands in for the requests module inside ai_engine; sleeps to mimic model latency"""
+
+    def __init__(self, latency: float, jitter: float):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(0)
+
+    def post(self, url, headers=None, json=None, stream=False, **kwargs):
+        time.sleep(max(0.0, self._rng.gauss(self.latency, self.jitter)))
+        prompt = json["contents"][0]["parts"][0]["text"]
+        if "debate topics" in prompt:
+            return StubResponse("Topic one?\nTopic two?\nTopic three?")
+        scores = [self._rng.randint(3, 9) for _ in range(3)]
+        return StubResponse(f"Logic: {scores[0]}\nRelevance: {scores[1]}\nPersuasiveness: {scores[2]}")
+
+
+def load_app(args):
+    """Import main.py with the chosen storage and scoring backends wired in"""
+    os.environ.setdefault("TRACING_ENABLED", "false")
+    if args.storage == "memory":
+        import minio
+        store = InMemoryMinio()
+        minio.Minio = lambda *a, **k: store
+        os.environ.setdefault("MINIO_ACCESS_KEY", "simulator")
+        os.environ.setdefault("MINIO_SECRET_KEY", "simulator")
+
+    import ai_engine
+    import main
+    if args.llm == "stub":
+        ai_engine.requests = StubRequests(args.llm_latency, args.llm_jitter)
+    return main
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Bot:
+    """One simulated debate between two bot players"""
+
+    def __init__(self, client, stats, run_id: str, index: int, args):
+        self.client = client
+        self.stats = stats
+        self.rng = random.Random(f"{run_id}-{index}")
+        self.players = (f"sim{run_id}_{index}_a", f"sim{run_id}_{index}_b")
+        self.args = args
+
+    async def request(self, kind, method, url, **kwargs):
+        """Send a request, honouring Retry-After when the API sheds load"""
+        for _ in range(self.args.max_retries + 1):
+            start = time.perf_counter()
+            response = await self.client.request(method, url, **kwargs)
+            self.stats.latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            if response.status_code not in (429, 503):
+                if response.status_code >= 400:
+                    self.stats.errors[f"{kind}:{response.status_code}"] += 1
+                return response
+            self.stats.shed[kind] += 1
+            retry_after = float(response.headers.get("Retry-After", "1"))
+            await asyncio.sleep(retry_after * self.args.retry_scale)
+        return response
+
+    async def run(self):
+        p1, p2 = self.players
+        for player in self.players:
+            await self.request("create_player", "POST", "/players/create", json={"player_name": player})
+
+        genre = self.rng.choice(GENRES)
+        response = await self.request("topics", "GET", f"/topics/{genre}")
+        topics = response.json().get("topics") if response.status_code == 200 else None
+        topic = self.rng.choice(topics or CORPUS)
+
+        response = await self.request("create_room", "POST", f"/create-room/{p1}", params={"topic": topic})
+        if response.status_code != 200:
+            return
+        room_key = response.json()["room_key"]
+        response = await self.request("join_room", "POST", f"/join-room/{room_key}", json={"player_name": p2})
+        if response.status_code != 200:
+            return
+
+        for round_num in range(1, 6):
+            for player in self.players:
+                if self.args.arguments == "corpus":
+                    argument = self.rng.choice(CORPUS)
+                else:
+                    argument = generated_argument(self.rng, round_num)
+                response = await self.request("submit", "POST", f"/submit-argument/{room_key}/{player}",
+                                              json={"argument": argument})
+                if response.status_code != 200:
+                    return
+
+        status = response.json().get("status")
+        deadline = time.perf_counter() + self.args.scoring_timeout
+        while status == "scoring":
+            # Rounds that missed the scoring deadline are still being reconciled
+            if time.perf_counter() > deadline:
+                self.stats.errors["scoring_timeout"] += 1
+                return
+            await asyncio.sleep(0.1)
+            response = await self.request("room_status", "GET", f"/room-status/{room_key}")
+            status = response.json()["room"]["status"]
+        if status == "completed":
+            self.stats.completed += 1
+        elif status == "failed":
+            self.stats.errors["room_failed"] += 1
+
+
+class LevelStats:
+    def __init__(self):
+        self.latencies = {}
+        self.shed = Counter()
+        self.errors = Counter()
+        self.completed = 0
+
+
+async def run_level(main, args, concurrency: int, run_id: str) -> dict:
+    import httpx
+    from token_budget import ledger
+
+    stats = LevelStats()
+    calls_before = ledger.totals["calls"]
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://simulator", timeout=None) as client:
+        async def one(index):
+            async with semaphore:
+                try:
+                    await Bot(client, stats, run_id, index, args).run()
+                except Exception as e:
+                    stats.errors[type(e).__name__] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.debates)))
+        elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in stats.latencies.values() for value in values]
+    submit = stats.latencies.get("submit", [])
+    llm_calls = ledger.totals["calls"] - calls_before
+    return {
+        "concurrency": concurrency,
+        "debates": args.debates,
+        "completed": stats.completed,
+        "seconds": round(elapsed, 3),
+        "rooms_per_second": round(stats.completed / elapsed, 3),
+        "llm_calls": llm_calls,
+        "llm_calls_per_second": round(llm_calls / elapsed, 3),
+        "latency_p50_ms": round(percentile(all_latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(all_latencies, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(all_latencies, 0.99) * 1000, 1),
+        "submit_p95_ms": round(percentile(submit, 0.95) * 1000, 1),
+        "shed": dict(stats.shed),
+        "errors": dict(stats.errors)
+    }
+
+
+def print_table(rows):
+    columns = ["concurrency", "completed", "rooms_per_second", "llm_calls_per_second",
+               "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "submit_p95_ms"]
+    print(" ".join(f"{c:>20}" for c in columns))
+    for row in rows:
+        print(" ".join(f"{row[c]:>20}" for c in columns))
+        if row["shed"] or row["errors"]:
+            print(f"{'':>20} shed={row['shed']} errors={row['errors']}")
+
+
+async def simulate(args):
+    main = load_app(args)
+    run_id = datetime.datetime.utcnow().strftime("%H%M%S")
+    rows = []
+    for concurrency in args.levels:
+        print(f"[INFO] Running {args.debates} debates at concurrency {concurrency}...")
+        rows.append(await run_level(main, args, concurrency, f"{run_id}c{concurrency}"))
+    print_table(rows)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(rows, file, indent=2)
+        print(f"[INFO] Capacity curves written to {args.output}")
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run synthetic bot-vs-bot debates against the debate API")
+    parser.add_argument("--debates", type=int, default=100, help="debates to run at each concurrency level")
+    parser.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16, 64],
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--llm", choices=["stub", "real"], default="stub", help="scoring backend")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="mean stub model latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="stub model latency standard deviation")
+    parser.add_argument("--storage", choices=["minio", "memory"], default="minio",
+                        help="use the configured MinIO server or an in-process object store")
+    parser.add_argument("--arguments", choices=["corpus", "generated"], default="generated")
+    parser.add_argument("--max-retries", type=int, default=5, help="retries after a 429/503 response")
+    parser.add_argument("--retry-scale", type=float, default=1.0, help="multiplier applied to Retry-After")
+    parser.add_argument("--scoring-timeout", type=float, default=120.0,
+                        help="seconds to wait for late round scores before counting the debate as an error")
+    parser.add_argument("--output", help="write capacity curves as JSON to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(simulate(parse_args(sys.argv[1:])))
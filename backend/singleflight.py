@@ -0,0 +1,71 @@
+import asyncio
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: while a call for a key is in flight,
+    later callers with the same key await the same task instead of starting
+    their own. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name: str, clone: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        # Followers get clone(result) so they can't mutate the leader's object
+        self.clone = clone
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            result = await asyncio.shield(task)
+            return self.clone(result) if self.clone else result
+
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so one caller being cancelled doesn't cancel the shared call
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight)
+        }
+
+
+_groups: Dict[str, SingleFlight] = {}
+
+
+def single_flight(name: Optional[str] = None, clone: Optional[Callable[[Any], Any]] = None):
+    """
+    Decorator for async functions and methods. Calls are keyed by their
+    positional and keyword arguments (including self), which must be hashable.
+    """
+    def decorator(func):
+        group = SingleFlight(name or func.__qualname__, clone)
+        _groups[group.name] = group
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return await group.do(key, func, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+    return decorator
+
+
+def stats() -> dict:
+    """Call and coalescing counts for every single_flight group"""
+    return {name: group.stats() for name, group in _groups.items()}
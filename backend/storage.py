@@ -0,0 +1,179 @@
+"""
+Object key layout for MinIO.
+
+Records are stored under hash-sharded keys, e.g. players/3f/alice.json, so a
+full scan can list and fetch 256 independent prefixes in parallel instead of
+walking one flat prefix. The original flat keys (player_alice.json) are the
+"legacy" layout.
+
+STORAGE_LAYOUT controls the cutover:
+    legacy  - read and write flat keys only
+    dual    - write sharded keys; read sharded first, then fall back to legacy
+    sharded - sharded keys only (after migrate_storage.py has run)
+"""
+import os
+import hashlib
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from minio import Minio
+from minio.error import S3Error
+
+import codec
+from tracing import span
+
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "dual").lower()
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "16"))
+SHARD_CHARS = 2
+
+# kind -> (sharded prefix, legacy prefix)
+KINDS = {
+    "player": ("players", "player_"),
+    "debate": ("debates", "debate_"),
+    "abort": ("aborts", "abort_"),
+    # Room key reservations (see main.reserve_room_key); always sharded
+    "room": ("rooms", "room_"),
+}
+
+if STORAGE_LAYOUT not in ("legacy", "dual", "sharded"):
+    raise ValueError("STORAGE_LAYOUT must be one of: legacy, dual, sharded")
+
+
+def shard(name: str) -> str:
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:SHARD_CHARS]
+
+
+def all_shards() -> List[str]:
+    return [f"{i:0{SHARD_CHARS}x}" for i in range(16 ** SHARD_CHARS)]
+
+
+def sharded_key(kind: str, name: str) -> str:
+    return f"{KINDS[kind][0]}/{shard(name)}/{name}.json"
+
+
+def legacy_key(kind: str, name: str) -> str:
+    return f"{KINDS[kind][1]}{name}.json"
+
+
+def name_from_key(kind: str, key: str) -> str:
+    sharded_prefix, legacy_prefix = KINDS[kind]
+    if key.startswith(sharded_prefix + "/"):
+        return key.rsplit("/", 1)[1][:-len(".json")]
+    return key[len(legacy_prefix):-len(".json")]
+
+
+def write_key(kind: str, name: str) -> str:
+    return legacy_key(kind, name) if STORAGE_LAYOUT == "legacy" else sharded_key(kind, name)
+
+
+def read_keys(kind: str, name: str) -> List[str]:
+    if STORAGE_LAYOUT == "legacy":
+        return [legacy_key(kind, name)]
+    if STORAGE_LAYOUT == "dual":
+        return [sharded_key(kind, name), legacy_key(kind, name)]
+    return [sharded_key(kind, name)]
+
+
+def get_bytes(client: Minio, bucket: str, kind: str, name: str) -> Optional[bytes]:
+    """Read a record, trying each key the current layout allows; None if it doesn't exist"""
+    for key in read_keys(kind, name):
+        try:
+            with span("minio.get_object", object_name=key):
+                response = client.get_object(bucket, key)
+                return response.read()
+        except Exception:
+            continue
+    return None
+
+
+def put_bytes(client: Minio, bucket: str, kind: str, name: str, data: bytes):
+    key = write_key(kind, name)
+    with span("minio.put_object", object_name=key):
+        client.put_object(bucket, key, BytesIO(data), length=len(data))
+
+
+def put_json(client: Minio, bucket: str, kind: str, name: str, record: dict):
+    put_bytes(client, bucket, kind, name, codec.dumps(record))
+
+
+def _put_if(client: Minio, bucket: str, key: str, data: bytes, condition: Dict[str, str]) -> bool:
+    """
+    Conditional PUT; returns False if the precondition failed. The check and
+    the write are one atomic request, so a concurrent writer is never lost.
+
+    minio-py's put_object turns unknown headers into user metadata, so this
+    sends the single-request upload directly; it needs a MinIO release with
+    conditional writes and an object small enough for one PUT. _put_object is
+    private API: requirements.txt pins the minio-py releases it is tested
+    against (tests/test_storage.py), and nothing else should call it.
+    """
+    headers = {"Content-Type": "application/octet-stream", **condition}
+    try:
+        with span("minio.put_object", object_name=key):
+            client._put_object(bucket, key, data, headers=headers)
+    except S3Error as e:
+        if e.code == "PreconditionFailed":
+            return False
+        raise
+    return True
+
+
+def create_object(client: Minio, bucket: str, key: str, data: bytes) -> bool:
+    """Write an object only if the key is free (If-None-Match: *); False if it already exists"""
+    return _put_if(client, bucket, key, data, {"If-None-Match": "*"})
+
+
+def replace_object(client: Minio, bucket: str, key: str, data: bytes, etag: str) -> bool:
+    """Overwrite an object only if it still has this ETag (If-Match); False if it has changed"""
+    return _put_if(client, bucket, key, data, {"If-Match": f'"{etag}"'})
+
+
+def _list_prefix(client: Minio, bucket: str, prefix: str) -> List[str]:
+    return [obj.object_name for obj in client.list_objects(bucket, prefix=prefix, recursive=True)]
+
+
+def list_keys(client: Minio, bucket: str, kind: str, workers: int = STORAGE_WORKERS) -> Dict[str, str]:
+    """
+    Map every record name of a kind to the key it should be read from.
+    Shards are listed concurrently; in dual mode a sharded copy wins over a legacy one.
+    """
+    sharded_prefix, legacy_prefix = KINDS[kind]
+    prefixes = []
+    if STORAGE_LAYOUT != "sharded":
+        prefixes.append(legacy_prefix)
+    if STORAGE_LAYOUT != "legacy":
+        prefixes.extend(f"{sharded_prefix}/{s}/" for s in all_shards())
+
+    with span("minio.list_shards", kind=kind, prefixes=len(prefixes)):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            listings = list(pool.map(lambda prefix: _list_prefix(client, bucket, prefix), prefixes))
+
+    keys: Dict[str, str] = {}
+    for prefix, listing in zip(prefixes, listings):
+        for key in listing:
+            # Legacy is listed first, so sharded copies overwrite it
+            keys[name_from_key(kind, key)] = key
+    return keys
+
+
+def load_all(client: Minio, bucket: str, kind: str, decode: Callable[[bytes], object],
+             workers: int = STORAGE_WORKERS) -> List[object]:
+    """Fetch and decode every record of a kind concurrently; unreadable records are skipped"""
+    keys = list(list_keys(client, bucket, kind, workers).values())
+
+    def load(key):
+        try:
+            return decode(client.get_object(bucket, key).read())
+        except Exception as e:
+            print(f"Error loading {key}: {e}")
+            return None
+
+    with span("minio.load_shards", kind=kind, objects=len(keys)):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return [record for record in pool.map(load, keys) if record is not None]
+
+
+def legacy_objects(client: Minio, bucket: str, kind: str) -> List[Tuple[str, str]]:
+    """(name, legacy key) for every flat-layout object of a kind"""
+    return [(name_from_key(kind, key), key) for key in _list_prefix(client, bucket, KINDS[kind][1])]
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import minio
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TRACING_ENABLED", "false")
+os.environ.setdefault("MINIO_ACCESS_KEY", "test")
+os.environ.setdefault("MINIO_SECRET_KEY", "test")
+
+import simulator
+
+# Modules create their MinIO clients at import time, so swap in the in-memory
+# store before any test module imports them
+_store = simulator.InMemoryMinio()
+minio.Minio = lambda *args, **kwargs: _store
+
+
+@pytest.fixture(scope="session")
+def app_main():
+    """main.py on the in-memory object store, scoring with the simulator's stub model"""
+    from types import SimpleNamespace
+
+    return simulator.load_app(SimpleNamespace(storage="minio", llm="stub", llm_latency=0.0, llm_jitter=0.0))
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def controller(**overrides):
+    options = dict(max_concurrency=1, per_key_limit=2, max_queue=2, max_wait=1.0)
+    options.update(overrides)
+    return AdmissionController("test", **options)
+
+
+def test_per_key_limit_rejects_with_429():
+    async def run():
+        admission = controller(max_concurrency=4)
+        await admission.acquire("alice")
+        await admission.acquire("alice")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("alice")
+        await admission.acquire("bob")
+        return admission, rejected.value
+
+    admission, rejected = asyncio.run(run())
+    assert rejected.status_code == 429 and rejected.retry_after >= 1
+    assert admission.stats()["active"] == 3 and admission.rejected_per_key == 1
+
+
+def test_slots_are_handed_over_in_fifo_order():
+    async def run():
+        admission = controller(max_queue=4)
+        order = []
+        admitted_at = await admission.acquire()
+
+        async def wait(name):
+            at = await admission.acquire()
+            order.append(name)
+            admission.release(None, at)
+
+        waiters = [asyncio.ensure_future(wait(name)) for name in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        assert admission.stats()["queue_depth"] == 3
+        admission.release(None, admitted_at)
+        await asyncio.gather(*waiters)
+        return admission, order
+
+    admission, order = asyncio.run(run())
+    assert order == ["a", "b", "c"]
+    assert admission.stats()["active"] == 0
+
+
+def test_full_queue_and_queue_deadline_are_shed_with_503():
+    async def run():
+        admission = controller(max_queue=1, max_wait=0.05)
+        await admission.acquire("alice")
+        queued = asyncio.ensure_future(admission.acquire("bob"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await admission.acquire("carol")
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await queued
+        return admission, full.value, timed_out.value
+
+    admission, full, timed_out = asyncio.run(run())
+    assert full.status_code == 503 and timed_out.status_code == 503
+    assert admission.shed_queue_full == 1 and admission.shed_deadline == 1
+    # Shed requests give their per-player claim back
+    assert dict(admission._per_key) == {"alice": 1}
+
+
+def test_detached_slot_stays_busy_until_released():
+    async def run():
+        admission = controller(per_key_limit=1, max_wait=0.05)
+        admitted_at = await admission.acquire("alice")
+        admission.detach("alice")
+        # alice may queue again, but the slot is still taken by the detached work
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("alice")
+        admission.release(None, admitted_at)
+        await admission.acquire("alice")
+        return admission, rejected.value
+
+    admission, rejected = asyncio.run(run())
+    assert rejected.status_code == 503
+    assert admission.stats()["active"] == 1
+
+
+def test_submit_publishes_the_argument_before_scoring(app_main, monkeypatch):
+    """A submission that completes a round is visible to the opponent while it is being scored"""
+    main = app_main
+    release = threading.Event()
+    score_round = main.score_round
+
+    def slow_score_round(*args, **kwargs):
+        release.wait(5)
+        return score_round(*args, **kwargs)
+
+    monkeypatch.setattr(main, "score_round", slow_score_round)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            for player in ("pub_alice", "pub_bob"):
+                await client.post("/players/create", json={"player_name": player})
+            room_key = (await client.post("/create-room/pub_alice", params={"topic": "Is cereal a soup?"})).json()["room_key"]
+            await client.post(f"/join-room/{room_key}", json={"player_name": "pub_bob"})
+            await client.post(f"/submit-argument/{room_key}/pub_alice", json={"argument": "Soup is a liquid dish."})
+
+            submit = asyncio.ensure_future(
+                client.post(f"/submit-argument/{room_key}/pub_bob", json={"argument": "Cereal is not cooked."}))
+            await asyncio.sleep(0.1)
+            during = (await client.get(f"/room-status/{room_key}")).json()
+            release.set()
+            await submit
+            after = (await client.get(f"/room-status/{room_key}")).json()
+            return during, after
+
+    during, after = asyncio.run(run())
+    assert [argument["player"] for argument in during["all_arguments"]] == ["pub_alice", "pub_bob"]
+    assert during["room"]["round_results"] == []
+    assert len(after["room"]["round_results"]) == 1
+    assert after["room"]["version"] > during["room"]["version"]
+
+
+def test_coalesced_topic_requests_share_one_admission_slot(app_main, monkeypatch):
+    main = app_main
+    release = threading.Event()
+    generate = main.generate_debate_topics_by_genre
+
+    def slow_generate(genre):
+        release.wait(5)
+        return generate(genre)
+
+    monkeypatch.setattr(main, "generate_debate_topics_by_genre", slow_generate)
+    monkeypatch.setattr(main, "llm_admission", controller(max_concurrency=2, max_queue=2))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            requests = [asyncio.ensure_future(client.get("/topics/sports")) for _ in range(8)]
+            await asyncio.sleep(0.1)
+            active = main.llm_admission.stats()["active"]
+            release.set()
+            return active, [response.status_code for response in await asyncio.gather(*requests)]
+
+    active, statuses = asyncio.run(run())
+    assert active == 1
+    assert statuses == [200] * 8
+
+
+def test_only_submissions_that_complete_a_round_are_admitted(app_main, monkeypatch):
+    main = app_main
+    # No free slots: anything that asks for one is shed
+    monkeypatch.setattr(main, "llm_admission", controller(max_concurrency=1, max_queue=0))
+
+    async def run():
+        await main.llm_admission.acquire()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            for player in ("adm_alice", "adm_bob"):
+                await client.post("/players/create", json={"player_name": player})
+            room_key = (await client.post("/create-room/adm_alice", params={"topic": "Is cereal a soup?"})).json()["room_key"]
+            await client.post(f"/join-room/{room_key}", json={"player_name": "adm_bob"})
+            submit = lambda player: client.post(f"/submit-argument/{room_key}/{player}", json={"argument": "Soup is wet."})
+            wrong_turn = await submit("adm_bob")
+            opening = await submit("adm_alice")
+            closing = await submit("adm_bob")
+            return wrong_turn.status_code, opening.status_code, closing.status_code
+
+    wrong_turn, opening, closing = asyncio.run(run())
+    assert (wrong_turn, opening, closing) == (400, 200, 503)
+    assert main.llm_admission.admitted == 1
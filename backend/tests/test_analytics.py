@@ -0,0 +1,139 @@
+import datetime
+import json
+
+import pytest
+
+import analytics
+import storage
+from analytics import AnalyticsRollup
+from simulator import InMemoryMinio
+
+BUCKET = "debate-history"
+
+
+@pytest.fixture(autouse=True)
+def always_refresh(monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_REFRESH_SECONDS", 0)
+
+
+def debate(game_id, winner="alice"):
+    return {
+        "game_id": game_id,
+        "topic": "Is cereal a soup?",
+        "genre": "philosophy",
+        "players": {"player1": {"name": "alice"}, "player2": {"name": "bob"}},
+        "winner": winner,
+        "rounds": [{"player1_score": {"logic": 8, "relevance": 7, "persuasiveness": 6},
+                    "player2_score": {"logic": 5, "relevance": 5, "persuasiveness": 5}}],
+        "timestamp": str(datetime.datetime.utcnow())
+    }
+
+
+def journal(client):
+    return [name for name in client._objects if name.startswith(analytics.JOURNAL_PREFIX)]
+
+
+def test_workers_folding_the_same_rollup_count_every_update_once():
+    client = InMemoryMinio()
+    workers = [AnalyticsRollup(client, BUCKET), AnalyticsRollup(client, BUCKET)]
+    for i in range(6):
+        workers[i % 2].record_debate(debate(f"G{i}"))
+    assert workers[0].save() and workers[1].save() and workers[0].save()
+
+    reader = AnalyticsRollup(client, BUCKET)
+    assert reader.player("alice")["debates"] == 6
+    assert reader.genre("philosophy")["wins"] == 6
+
+
+def test_unfolded_updates_survive_a_crash():
+    client = InMemoryMinio()
+    AnalyticsRollup(client, BUCKET).record_debate(debate("G1"))
+    # The worker exits without folding; the next one still sees its update
+    restarted = AnalyticsRollup(client, BUCKET)
+    assert restarted.player("bob")["losses"] == 1
+    assert restarted.save()
+    assert AnalyticsRollup(client, BUCKET).player("bob")["losses"] == 1
+
+
+def test_recording_only_writes_the_journal():
+    client = InMemoryMinio()
+    worker = AnalyticsRollup(client, BUCKET)
+    for i in range(25):
+        worker.record_debate(debate(f"G{i}"))
+    assert analytics.ANALYTICS_OBJECT not in client._objects
+    assert len(journal(client)) == 25 and worker.pending()
+
+
+def test_folded_journal_entries_are_deleted_and_not_remembered():
+    client = InMemoryMinio()
+    worker = AnalyticsRollup(client, BUCKET)
+    worker.record_debate(debate("G1"))
+    worker.record_abort({"game_id": "G2", "topic": "t", "aborted_by": "bob", "opponent": "alice",
+                         "timestamp": str(datetime.datetime.utcnow())})
+    assert worker.save() and not worker.pending()
+    assert journal(client) == []
+    assert worker.save()
+    rollup = json.loads(client._objects[analytics.ANALYTICS_OBJECT])
+    assert rollup["folded"] == {} and rollup["covered"] == {}
+    assert AnalyticsRollup(client, BUCKET).player("bob")["aborts"] == 1
+    assert AnalyticsRollup(client, BUCKET).player("alice")["forfeit_wins"] == 1
+
+
+def test_entries_left_behind_by_a_failed_delete_are_not_counted_twice(monkeypatch):
+    client = InMemoryMinio()
+    worker = AnalyticsRollup(client, BUCKET)
+    worker.record_debate(debate("G1"))
+    with monkeypatch.context() as patched:
+        patched.setattr(client, "remove_object", lambda *args, **kwargs: None)
+        assert worker.save()
+    assert len(journal(client)) == 1
+    assert list(json.loads(client._objects[analytics.ANALYTICS_OBJECT])["folded"]) == ["debate:G1"]
+
+    assert AnalyticsRollup(client, BUCKET).save()
+    assert journal(client) == []
+    assert AnalyticsRollup(client, BUCKET).player("alice")["debates"] == 1
+
+
+def test_rebuild_keeps_updates_made_while_it_runs(monkeypatch):
+    client = InMemoryMinio()
+    worker = AnalyticsRollup(client, BUCKET)
+    storage.put_json(client, BUCKET, "debate", "G1", debate("G1"))
+    worker.record_debate(debate("G1"))
+    load_all = storage.load_all
+
+    def load_then_finish_a_debate(*args, **kwargs):
+        records = load_all(*args, **kwargs)
+        if args[2] == "abort":
+            # G2 finishes after the archive was read
+            storage.put_json(client, BUCKET, "debate", "G2", debate("G2", winner="bob"))
+            worker.record_debate(debate("G2", winner="bob"))
+        return records
+
+    monkeypatch.setattr(storage, "load_all", load_then_finish_a_debate)
+    worker.rebuild()
+    monkeypatch.setattr(storage, "load_all", load_all)
+    # G1's journal entry lands after the rebuild listed the journal; it is already counted
+    worker.record_debate(debate("G1"))
+    assert worker.save()
+
+    alice = AnalyticsRollup(client, BUCKET).player("alice")
+    assert (alice["debates"], alice["wins"], alice["losses"]) == (2, 1, 1)
+
+
+def test_fold_retries_when_another_worker_folds_first():
+    client = InMemoryMinio()
+    first, second = AnalyticsRollup(client, BUCKET), AnalyticsRollup(client, BUCKET)
+    first.record_debate(debate("G1"))
+    second.record_debate(debate("G2"))
+    list_journal = first._list_journal
+    raced = []
+
+    def list_while_the_other_worker_folds():
+        listing = list_journal()
+        if not raced:
+            raced.append(second.save())
+        return listing
+
+    first._list_journal = list_while_the_other_worker_folds
+    assert first.save() and raced == [True]
+    assert AnalyticsRollup(client, BUCKET).player("alice")["debates"] == 2
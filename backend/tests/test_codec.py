@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import codec
+from models import Player
+
+
+def test_player_round_trip_is_versioned():
+    player = Player(username="alice", wins=3, rating=1532.5, rated_at=datetime(2026, 1, 2, 3, 4, 5))
+    data = codec.encode_player(player)
+    assert codec.loads(data)[codec.VERSION_KEY] == codec.PLAYER_SCHEMA_VERSION
+    assert codec.decode_player(data) == player
+
+
+def test_unversioned_records_are_upgraded():
+    unrated = b'{"username":"bob","total_score":1,"games_played":1,"wins":0,"losses":1,' \
+              b'"created_at":"2026-01-02T03:04:05"}'
+
+    bob = codec.decode_player(unrated)
+
+    assert (bob.rating, bob.rating_epoch, bob.rated_at, bob.losses) == (1500.0, 0, None, 1)
+
+
+def test_upgrade_hooks_run_from_the_stored_version(monkeypatch):
+    def rename_score(record):
+        record["total_score"] = record.pop("score")
+        return record
+
+    # Pretend version 2 renamed "score" to "total_score"
+    monkeypatch.setattr(codec, "PLAYER_UPGRADES", codec.PLAYER_UPGRADES + [rename_score])
+    monkeypatch.setattr(codec, "_PLAYER_HEADER", b'{"schema_version":2,')
+    older = b'{"schema_version":1,"username":"carol","score":7,"created_at":"2026-01-02T03:04:05"}'
+
+    assert codec.decode_player(older).total_score == 7
+
+
+def test_plain_records_accept_datetimes():
+    record = {"game_id": "ABC123", "timestamp": datetime(2026, 1, 2, 3, 4, 5)}
+    assert codec.loads(codec.dumps(record)) == {"game_id": "ABC123", "timestamp": "2026-01-02T03:04:05"}
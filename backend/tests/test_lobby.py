@@ -0,0 +1,33 @@
+import storage
+from lobby import RoomKeyAllocator
+from simulator import InMemoryMinio
+
+
+def test_keys_reserved_by_another_worker_are_skipped():
+    client = InMemoryMinio()
+
+    def reserve(key):
+        return storage.create_object(client, "debate-history", storage.sharded_key("room", key), b"{}")
+
+    # Two workers drawing from a tiny key space share one bucket
+    workers = [RoomKeyAllocator(length=1, alphabet="AB", reserve=reserve) for _ in range(2)]
+    keys = [workers[i % 2].allocate() for i in range(6)]
+
+    assert len(set(keys)) == 6
+    assert sorted(keys[:2]) == ["A", "B"]
+    assert all(len(key) == 2 for key in keys[2:])
+
+
+def test_released_keys_stay_reserved():
+    reserved = set()
+
+    def reserve(key):
+        if key in reserved:
+            return False
+        reserved.add(key)
+        return True
+
+    allocator = RoomKeyAllocator(length=1, alphabet="A", reserve=reserve)
+    first = allocator.allocate()
+    allocator.release(first)
+    assert allocator.allocate() != first
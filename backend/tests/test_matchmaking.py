@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+
+from admission import AdmissionController
+from lobby import MatchQueue
+
+
+def test_unmatch_restores_queue_order():
+    queue = MatchQueue()
+    queue.enqueue("alice", 1500, "sports")
+    queue.enqueue("carol", 1500, "cinema")
+    first, second = queue.enqueue("bob", 1510, "sports")
+    queue.enqueue("dave", 1520, "sports")
+
+    queue.unmatch(first, second)
+
+    assert queue.stats() == {"queued": 4, "bands": 2, "matches_made": 0}
+    # alice has waited longest, so she is still matched first
+    assert queue.enqueue("erin", 1500, "sports")[0].player == "alice"
+
+
+def test_matched_players_stay_queued_when_topic_generation_is_shed(app_main, monkeypatch):
+    main = app_main
+    busy = AdmissionController("llm", max_concurrency=1, per_key_limit=1, max_queue=0, max_wait=0.1)
+    monkeypatch.setattr(main, "llm_admission", busy)
+
+    async def run():
+        await busy.acquire()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            for player in ("mm_alice", "mm_bob"):
+                await client.post("/players/create", json={"player_name": player})
+            await client.post("/matchmaking/mm_alice", params={"genre": "sports"})
+            shed = await client.post("/matchmaking/mm_bob", params={"genre": "sports"})
+            polls = [await client.get(f"/matchmaking/{player}") for player in ("mm_alice", "mm_bob")]
+            return shed, polls
+
+    shed, polls = asyncio.run(run())
+    assert shed.status_code == 503 and "Retry-After" in shed.headers
+    # Each poll is shed again, but neither player has lost their ticket
+    assert [poll.status_code for poll in polls] == [503, 503]
+    assert main.matchmaking.ticket("mm_alice") and main.matchmaking.ticket("mm_bob")
@@ -0,0 +1,50 @@
+import storage
+from migrate_storage import migrate, migrate_object
+from simulator import InMemoryMinio
+
+BUCKET = "debate-history"
+
+
+def put(client, key, data):
+    client._put_object(BUCKET, key, data)
+
+
+def test_migration_copies_and_never_overwrites_sharded_records():
+    client = InMemoryMinio()
+    put(client, storage.legacy_key("player", "alice"), b'{"username":"alice","wins":1}')
+    put(client, storage.legacy_key("player", "bob"), b'{"username":"bob","wins":1}')
+    # bob was already written by a dual-mode worker
+    put(client, storage.sharded_key("player", "bob"), b'{"username":"bob","wins":2}')
+
+    report = migrate(client, BUCKET, ["player"], workers=2)
+
+    assert report["player"] == {"legacy_objects": 2, "copied": 1, "skipped": 1}
+    assert client.get_object(BUCKET, storage.sharded_key("player", "alice")).read() == b'{"username":"alice","wins":1}'
+    assert client.get_object(BUCKET, storage.sharded_key("player", "bob")).read() == b'{"username":"bob","wins":2}'
+
+
+def test_write_between_read_and_copy_wins():
+    client = InMemoryMinio()
+    legacy = storage.legacy_key("player", "alice")
+    target = storage.sharded_key("player", "alice")
+    put(client, legacy, b"old")
+    get_object = client.get_object
+
+    def get_then_race(bucket, key, **kwargs):
+        response = get_object(bucket, key, **kwargs)
+        if key == legacy:
+            # The app saves alice after the migration has read the legacy object
+            put(client, target, b"new")
+        return response
+
+    client.get_object = get_then_race
+    assert migrate_object(client, BUCKET, "player", "alice", legacy, delete_legacy=True, dry_run=False) == "deleted"
+    assert get_object(BUCKET, target).read() == b"new"
+    assert legacy not in client._objects
+
+
+def test_create_object_reports_existing_keys():
+    client = InMemoryMinio()
+    assert storage.create_object(client, BUCKET, "rooms/ab/X.json", b"1")
+    assert not storage.create_object(client, BUCKET, "rooms/ab/X.json", b"2")
+    assert client.get_object(BUCKET, "rooms/ab/X.json").read() == b"1"
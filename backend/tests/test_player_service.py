@@ -0,0 +1,47 @@
+import asyncio
+
+from player_service import PlayerService
+from simulator import InMemoryMinio
+
+
+def test_concurrent_updates_are_not_lost():
+    async def run():
+        service = PlayerService(InMemoryMinio(), "debate-history")
+        for username in ("alice", "bob", "carol"):
+            await service.create_player(username)
+        # Overlapping debates for alice: each one reads and writes her record
+        await asyncio.gather(*(service.update_scores("alice", "bob" if i % 2 else "carol", 3, 1)
+                               for i in range(20)))
+        return [await service.get_player(username) for username in ("alice", "bob", "carol")]
+
+    alice, bob, carol = asyncio.run(run())
+    assert (alice.games_played, alice.wins, alice.total_score) == (20, 20, 40)
+    assert bob.losses + carol.losses == 20
+    assert alice.rating > bob.rating and alice.rating > carol.rating
+
+
+def test_abort_penalty_and_update_do_not_overwrite_each_other():
+    async def run():
+        service = PlayerService(InMemoryMinio(), "debate-history")
+        for username in ("alice", "bob"):
+            await service.create_player(username)
+        await asyncio.gather(service.update_scores("alice", "bob", 5, 0),
+                             service.apply_abort_penalty("bob", "alice"),
+                             service.update_scores("bob", "alice", 2, 1))
+        return await service.get_player("alice"), await service.get_player("bob")
+
+    alice, bob = asyncio.run(run())
+    assert alice.games_played == 2 and bob.games_played == 3
+    assert (alice.wins, alice.losses, bob.wins, bob.losses) == (1, 1, 1, 1)
+
+
+def test_locks_are_dropped_when_idle():
+    async def run():
+        service = PlayerService(InMemoryMinio(), "debate-history")
+        for username in ("alice", "bob"):
+            await service.create_player(username)
+        await asyncio.gather(*(service.update_scores("alice", "bob", 1, 0) for _ in range(5)))
+        return service
+
+    service = asyncio.run(run())
+    assert service._locks == {} and not service._lock_users
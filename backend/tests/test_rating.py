@@ -0,0 +1,36 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from models import Player
+from player_service import PlayerService
+from rating import RatingBook
+from simulator import InMemoryMinio
+
+
+def test_overlay_keeps_ratings_changed_after_the_snapshot():
+    book = RatingBook(InMemoryMinio(), "debate-history")
+    as_of = datetime.utcnow()
+    book.publish({"alice": 1600.0, "bob": 1400.0}, {"alice": 1, "bob": 1}, 1, as_of)
+
+    stale = book.overlay(Player(username="alice", rating=1516.0, rated_at=as_of - timedelta(seconds=1)))
+    fresh = book.overlay(Player(username="bob", rating=1484.0, rated_at=as_of + timedelta(seconds=1)))
+    unrated = book.overlay(Player(username="carol", rating=1510.0))
+
+    assert (stale.rating, stale.rating_epoch) == (1600.0, 1)
+    assert (fresh.rating, fresh.rating_epoch) == (1484.0, 1)
+    assert unrated.rating == 1500.0
+
+
+def test_update_during_a_rebuild_is_not_lost():
+    async def run():
+        service = PlayerService(InMemoryMinio(), "debate-history")
+        for username in ("alice", "bob"):
+            await service.create_player(username)
+        # A replay starts listing the archive, then a debate finishes before it publishes
+        as_of = datetime.utcnow()
+        await service.update_scores("alice", "bob", 3, 1)
+        service.ratings.publish({}, {}, 0, as_of)
+        return await service.get_player("alice"), await service.get_player("bob")
+
+    alice, bob = asyncio.run(run())
+    assert alice.rating == 1516.0 and bob.rating == 1484.0
@@ -0,0 +1,28 @@
+import asyncio
+
+import httpx
+
+
+def test_finished_rooms_are_dropped_after_the_retention_period(app_main, monkeypatch):
+    main = app_main
+    monkeypatch.setattr(main, "ROOM_RETENTION", 0.05)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            for player in ("ret_alice", "ret_bob"):
+                await client.post("/players/create", json={"player_name": player})
+            room_key = (await client.post("/create-room/ret_alice", params={"topic": "Is cereal a soup?"})).json()["room_key"]
+            await client.post(f"/join-room/{room_key}", json={"player_name": "ret_bob"})
+            await client.post(f"/submit-argument/{room_key}/ret_alice", json={"argument": "Soup is a liquid dish."})
+            await client.post(f"/abort-debate/{room_key}/ret_bob")
+
+            during = await client.get(f"/room-status/{room_key}")
+            await asyncio.gather(*main.background_tasks)
+            after = await client.get(f"/room-status/{room_key}")
+            return room_key, during, after
+
+    room_key, during, after = asyncio.run(run())
+    assert during.status_code == 200 and during.json()["room"]["status"] == "aborted"
+    assert after.status_code == 404
+    assert room_key not in main.room_snapshots._arguments
+    assert room_key not in main.room_keys._in_use
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def main(app_main, monkeypatch):
+    monkeypatch.setattr(app_main, "ROUND_SCORING_DEADLINE", 0.05)
+    return app_main
+
+
+def client_for(main):
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+async def start_room(client):
+    players = [f"p{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    for player in players:
+        await client.post("/players/create", json={"player_name": player})
+    room_key = (await client.post(f"/create-room/{players[0]}", params={"topic": "Is cereal a soup?"})).json()["room_key"]
+    await client.post(f"/join-room/{room_key}", json={"player_name": players[1]})
+    return room_key, players
+
+
+async def play_round(client, room_key, players, round_num):
+    response = None
+    for player in players:
+        response = await client.post(f"/submit-argument/{room_key}/{player}",
+                                     json={"argument": f"{player} makes point {round_num} because of evidence"})
+    return response
+
+
+def scorer(main, delay, error=None):
+    """Wrap score_round with a delay and optionally an error; returns it and the real scores it produced"""
+    score_round = main.score_round
+    produced = []
+
+    def slow_score_round(*args, **kwargs):
+        assert kwargs.get("fallback") is False
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        produced.append(score_round(*args, **kwargs))
+        return produced[-1]
+
+    return slow_score_round, produced
+
+
+def test_late_scores_replace_the_provisional_round(main, monkeypatch):
+    slow, produced = scorer(main, 0.3)
+    monkeypatch.setattr(main, "score_round", slow)
+
+    async def run():
+        async with client_for(main) as client:
+            room_key, players = await start_room(client)
+            response = (await play_round(client, room_key, players, 1)).json()
+            # The scoring thread still holds its admission slot after the response
+            active = main.llm_admission.stats()["active"]
+            await asyncio.gather(*main.background_tasks)
+            return response, active, main.debate_rooms[room_key]
+
+    response, active, room = asyncio.run(run())
+    assert response["round_result"]["provisional"] is True
+    assert active == 1
+    assert main.llm_admission.stats()["active"] == 0
+    assert room["round_results"][0]["provisional"] is False
+    assert room["round_results"][0]["scores"] == produced[0]
+
+
+def test_late_failure_keeps_the_provisional_scores(main, monkeypatch):
+    slow, _ = scorer(main, 0.3, RuntimeError("Gemini returned HTTP 500"))
+    monkeypatch.setattr(main, "score_round", slow)
+
+    async def run():
+        async with client_for(main) as client:
+            room_key, players = await start_room(client)
+            response = (await play_round(client, room_key, players, 1)).json()
+            await asyncio.gather(*main.background_tasks)
+            return response, main.debate_rooms[room_key]
+
+    response, room = asyncio.run(run())
+    provisional = response["round_result"]["scores"]
+    assert room["round_results"][0]["scores"] == provisional
+    assert room["round_results"][0]["provisional"] is False
+    assert provisional["player1_score"] != {"logic": 5, "relevance": 5, "persuasiveness": 5}
+
+
+def test_early_failure_records_the_heuristic_round(main, monkeypatch):
+    slow, _ = scorer(main, 0.0, RuntimeError("Gemini returned HTTP 500"))
+    monkeypatch.setattr(main, "score_round", slow)
+
+    async def run():
+        async with client_for(main) as client:
+            room_key, players = await start_room(client)
+            return (await play_round(client, room_key, players, 1)).json()
+
+    response = asyncio.run(run())
+    assert response["status"] == "in_progress"
+    assert response["round_result"]["provisional"] is False
+    assert main.llm_admission.stats()["active"] == 0
+
+
+def test_failed_finalize_marks_the_room_failed(main, monkeypatch):
+    async def broken_finalize(room_key, room):
+        raise RuntimeError("MinIO unavailable")
+
+    monkeypatch.setattr(main, "_finalize_debate", broken_finalize)
+
+    async def run():
+        async with client_for(main) as client:
+            room_key, players = await start_room(client)
+            for round_num in range(1, 6):
+                response = await play_round(client, room_key, players, round_num)
+            status = (await client.get(f"/room-status/{room_key}")).json()["room"]["status"]
+            return response, status
+
+    response, status = asyncio.run(run())
+    assert response.status_code == 500
+    assert status == "failed"
+
+
+def streamer(delay, error=None):
+    """Stand-in for stream_score_round: one partial score, then the round after a delay"""
+    def slow_stream_score_round(p1_arg, p2_arg, topic, round_num, *args, **kwargs):
+        assert kwargs.get("fallback") is False
+        yield {"type": "partial", "round": round_num, "player": "player1", "criterion": "logic", "score": 7.0}
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        yield {"type": "round", "result": {"round": round_num, "player1_score": {"logic": 7.0},
+                                           "player2_score": {"logic": 3.0}, "round_winner": "Player 1"}}
+
+    return slow_stream_score_round
+
+
+async def stream_round(client, room_key, players):
+    await client.post(f"/submit-argument/{room_key}/{players[0]}", json={"argument": "Soup is a liquid dish."})
+    response = await client.post(f"/submit-argument/{room_key}/{players[1]}/stream",
+                                 json={"argument": "Cereal is not cooked, because it is served cold."})
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_streamed_round_is_held_to_the_deadline(main, monkeypatch):
+    monkeypatch.setattr(main, "stream_score_round", streamer(0.3))
+
+    async def run():
+        async with client_for(main) as client:
+            room_key, players = await start_room(client)
+            events = await stream_round(client, room_key, players)
+            active = main.llm_admission.stats()["active"]
+            await asyncio.gather(*main.background_tasks)
+            return events, active, main.debate_rooms[room_key]
+
+    events, active, room = asyncio.run(run())
+    assert [event["type"] for event in events] == ["accepted", "partial", "round"]
+    assert events[-1]["round_result"]["provisional"] is True
+    assert active == 1
+    assert main.llm_admission.stats()["active"] == 0
+    assert room["round_results"][0]["provisional"] is False
+    assert room["round_results"][0]["scores"]["round_winner"] == "Player 1"
+
+
+def test_failed_stream_records_the_heuristic_round(main, monkeypatch):
+    monkeypatch.setattr(main, "stream_score_round", streamer(0.0, ValueError("Incomplete scores")))
+
+    async def run():
+        async with client_for(main) as client:
+            room_key, players = await start_room(client)
+            return await stream_round(client, room_key, players)
+
+    events = asyncio.run(run())
+    round_result = events[-1]["round_result"]
+    assert round_result["provisional"] is False
+    assert round_result["scores"]["player1_score"] != {"logic": 5.0, "relevance": 5.0, "persuasiveness": 5.0}
+    assert main.llm_admission.stats()["active"] == 0
+
+
+class EndlessStream:
+    """A 200 response whose model output never gets to the scores"""
+    status_code = 200
+
+    def iter_lines(self, decode_unicode=True):
+        while True:
+            time.sleep(0.01)
+            yield "data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": "Thinking. "}]}}]})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_score_stream_is_capped_by_gemini_timeout(main, monkeypatch):
+    import ai_engine
+
+    monkeypatch.setattr(ai_engine, "GEMINI_TIMEOUT", 0.1)
+    monkeypatch.setattr(ai_engine, "requests", SimpleNamespace(post=lambda *args, **kwargs: EndlessStream()))
+    argument = f"An argument nobody has scored before, {uuid.uuid4().hex}, because evidence says so"
+
+    with pytest.raises(TimeoutError):
+        list(ai_engine.stream_score_argument_turn(argument, "Is cereal a soup?", 1, fallback=False))
+    scores = dict(ai_engine.stream_score_argument_turn(argument, "Is cereal a soup?", 1))
+    assert scores == ai_engine.heuristic_scores(argument, "Is cereal a soup?")
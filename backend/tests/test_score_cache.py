@@ -0,0 +1,36 @@
+import simulator
+from score_cache import SemanticScoreCache, embed
+
+TOPIC = "Should college athletes be paid?"
+CLAIM = ("College athletes bring in billions in television and ticket revenue for their universities, "
+         "and they deserve a share of that revenue.")
+REBUTTAL = ("College athletes bring in billions in television and ticket revenue for their universities, "
+            "and they do not deserve a share of that revenue.")
+REWORDED = ("College athletes bring in billions in television and ticket revenue for their universities, "
+            "so they deserve a share of that revenue.")
+SCORES = {"logic": 8.0, "relevance": 9.0, "persuasiveness": 7.0}
+
+
+def cache(store=None):
+    return SemanticScoreCache(store or simulator.InMemoryMinio(), "debate-history")
+
+
+def test_negated_rebuttal_misses_the_cache():
+    scores = cache()
+    scores.insert(TOPIC, CLAIM, SCORES)
+    # Close enough to pass the similarity threshold on its own
+    assert float(embed(CLAIM) @ embed(REBUTTAL)) >= scores.threshold
+    assert scores.lookup(TOPIC, REBUTTAL) is None
+    assert scores.lookup(TOPIC, REWORDED) == SCORES
+
+
+def test_negation_counts_survive_a_reload():
+    store = simulator.InMemoryMinio()
+    saved = cache(store)
+    saved.insert(TOPIC, CLAIM, SCORES)
+    saved.insert(TOPIC, REBUTTAL, {"logic": 2.0, "relevance": 3.0, "persuasiveness": 1.0})
+    saved.save()
+
+    loaded = cache(store)
+    assert loaded.lookup(TOPIC, REWORDED) == SCORES
+    assert loaded.lookup(TOPIC, REBUTTAL)["logic"] == 2.0
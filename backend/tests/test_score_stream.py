@@ -0,0 +1,41 @@
+import pytest
+
+from ai_engine import ScoreStreamParser, parse_scores
+
+RESPONSE = "Logic: 10\nRelevance: 7.5\nPersuasiveness: 8"
+
+
+def feed_in_chunks(text, size):
+    parser = ScoreStreamParser()
+    seen = []
+    for start in range(0, len(text), size):
+        seen.extend(parser.feed(text[start:start + size]))
+    seen.extend(parser.close())
+    return parser, seen
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, len(RESPONSE)])
+def test_any_chunking_gives_the_same_scores(size):
+    parser, seen = feed_in_chunks(RESPONSE, size)
+    assert seen == [("logic", 10.0), ("relevance", 7.5), ("persuasiveness", 8.0)]
+    assert parser.complete
+
+
+def test_number_split_across_chunks_is_not_reported_early():
+    parser = ScoreStreamParser()
+    assert parser.feed("Logic: 1") == []
+    assert parser.feed("0\nRelevance: 7") == [("logic", 10.0)]
+    assert parser.feed(".") == []
+    assert parser.feed("5\n") == [("relevance", 7.5)]
+
+
+def test_scores_are_clamped_and_repeats_ignored():
+    parser = ScoreStreamParser()
+    found = parser.feed("**Logic**: 12\nLogic: 3\nRelevance - 6\nPersuasiveness: 4", final=True)
+    assert found == [("logic", 10.0), ("relevance", 6.0), ("persuasiveness", 4.0)]
+
+
+def test_parse_scores_requires_every_criterion():
+    assert parse_scores(RESPONSE) == {"logic": 10.0, "relevance": 7.5, "persuasiveness": 8.0}
+    with pytest.raises(ValueError):
+        parse_scores("Logic: 8\nRelevance: 6")
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def load(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {"key": key}
+
+    async def run():
+        group = SingleFlight("test", clone=dict)
+        results = await asyncio.gather(*(group.do("a", load, "a") for _ in range(5)), group.do("b", load, "b"))
+        return group, results
+
+    group, results = asyncio.run(run())
+    assert calls == ["a", "b"]
+    assert group.stats() == {"calls": 6, "coalesced": 4, "in_flight": 0}
+    # Followers get their own copy of the leader's result
+    assert all(result == {"key": "a"} for result in results[:5])
+    assert len({id(result) for result in results[:5]}) == 5
+
+
+def test_nothing_is_cached_after_the_call():
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        group = SingleFlight("test")
+        return await group.do("k", load), await group.do("k", load)
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    async def load():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        group = SingleFlight("test")
+        leader = asyncio.ensure_future(group.do("k", load))
+        follower = asyncio.ensure_future(group.do("k", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader
+
+    result, leader = asyncio.run(run())
+    assert result == "done"
+    assert leader.cancelled()
+
+
+def test_errors_reach_every_caller():
+    async def load():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        group = SingleFlight("test")
+        return await asyncio.gather(group.do("k", load), group.do("k", load), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        asyncio.run(SingleFlight("test").do("k", load))
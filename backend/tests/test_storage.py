@@ -0,0 +1,59 @@
+import minio.api
+import pytest
+import urllib3
+from minio.error import S3Error
+
+import storage
+
+PRECONDITION_FAILED = (b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>PreconditionFailed</Code>'
+                       b'<Message>At least one of the pre-conditions you specified did not hold</Message>'
+                       b'<Resource>/debate-history/rooms/ab/ABC123.json</Resource><RequestId>1</RequestId></Error>')
+ACCESS_DENIED = PRECONDITION_FAILED.replace(b"PreconditionFailed", b"AccessDenied")
+
+
+class RecordingPool(urllib3.PoolManager):
+    """Answers every request with one canned response and records what was sent"""
+
+    def __init__(self, status, body=b""):
+        super().__init__()
+        self.status = status
+        self.body = body
+        self.requests = []
+
+    def urlopen(self, method, url, body=None, headers=None, **kwargs):
+        self.requests.append((method, url, dict(headers or {}), body))
+        return urllib3.HTTPResponse(body=self.body, status=self.status, preload_content=True,
+                                    headers={"ETag": '"abc"', "Content-Type": "application/xml"})
+
+
+def real_client(pool):
+    # conftest swaps minio.Minio for the in-memory store; these tests need minio-py's own client
+    return minio.api.Minio("localhost:9000", access_key="test", secret_key="test", secure=False,
+                           region="us-east-1", http_client=pool)
+
+
+def test_create_object_sends_if_none_match():
+    pool = RecordingPool(200)
+    assert storage.create_object(real_client(pool), "debate-history", "rooms/ab/ABC123.json", b"{}")
+    method, url, headers, body = pool.requests[0]
+    assert (method, url, body) == ("PUT", "http://localhost:9000/debate-history/rooms/ab/ABC123.json", b"{}")
+    assert headers["If-None-Match"] == "*"
+    assert not any(name.lower().startswith("x-amz-meta-") for name in headers)
+
+
+def test_replace_object_sends_a_quoted_if_match():
+    pool = RecordingPool(200)
+    assert storage.replace_object(real_client(pool), "debate-history", "stats/rollup.json", b"{}", "abc")
+    assert pool.requests[0][2]["If-Match"] == '"abc"'
+
+
+def test_failed_precondition_returns_false_without_retrying():
+    pool = RecordingPool(412, PRECONDITION_FAILED)
+    assert not storage.create_object(real_client(pool), "debate-history", "rooms/ab/ABC123.json", b"{}")
+    assert len(pool.requests) == 1
+
+
+def test_other_errors_are_raised():
+    pool = RecordingPool(403, ACCESS_DENIED)
+    with pytest.raises(S3Error):
+        storage.create_object(real_client(pool), "debate-history", "rooms/ab/ABC123.json", b"{}")
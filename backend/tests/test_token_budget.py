@@ -0,0 +1,22 @@
+from token_budget import TokenLedger, attribute, compact_text
+
+
+def test_per_room_totals_keep_the_most_recently_charged_rooms():
+    ledger = TokenLedger(max_keys=2)
+    for room_key in ("A", "B", "A", "C"):
+        with attribute(room_key=room_key, player=f"player{room_key}"):
+            ledger.record("score", 100, 10)
+
+    assert list(ledger.by_room) == ["A", "C"]
+    assert ledger.for_room("A")["calls"] == 2
+    assert ledger.for_room("B") is None
+    assert ledger.for_player("playerB") is None
+    assert ledger.totals["calls"] == 4
+
+
+def test_compact_text_trims_on_a_word_boundary():
+    text = "word " * 100
+    compacted = compact_text(" \x00" + text, budget=10)
+    assert compacted.endswith(" ...")
+    assert len(compacted) <= 10 * 4 + 4
+    assert compact_text("short   argument") == "short argument"
@@ -0,0 +1,48 @@
+import asyncio
+import json
+import threading
+
+import httpx
+
+import tracing
+
+
+def test_traces_are_written_by_the_exporter_thread(tmp_path, monkeypatch):
+    exporter = tracing.JsonFileExporter(directory=str(tmp_path), min_duration_ms=0)
+    writers = []
+    write = exporter._write
+
+    def record_writer(record):
+        writers.append(threading.current_thread().name)
+        write(record)
+
+    monkeypatch.setattr(exporter, "_write", record_writer)
+    trace = tracing.Trace()
+    root = tracing.Span("GET /players/{username}", trace)
+    trace.spans.append(root)
+    root.finish()
+
+    exporter.export(trace, root)
+    exporter.flush()
+
+    assert writers == ["trace-exporter"]
+    [path] = tmp_path.iterdir()
+    assert json.loads(path.read_text())["trace_id"] == trace.trace_id
+
+
+def test_profiles_are_finished_off_the_event_loop(app_main, monkeypatch):
+    main = app_main
+    finished = []
+    monkeypatch.setattr(tracing.profiling, "finish",
+                        lambda profiler, label=None: finished.append(threading.current_thread()) or profiler.stop())
+    monkeypatch.setattr(tracing.profiling, "enabled", True)
+    monkeypatch.setattr(tracing.profiling, "sample_rate", 1.0)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            response = await client.get("/")
+        tracing.profiling._active.release()
+        return response.status_code
+
+    assert asyncio.run(run()) == 200
+    assert finished and finished[0] is not threading.main_thread()
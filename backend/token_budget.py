@@ -0,0 +1,139 @@
+import os
+import re
+import math
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+# Arguments are trimmed to this many (estimated) tokens before scoring
+ARGUMENT_TOKEN_BUDGET = int(os.getenv("ARGUMENT_TOKEN_BUDGET", "300"))
+# Rough Gemini tokenizer ratio for English text, used when the API doesn't report usage
+CHARS_PER_TOKEN = 4
+RECENT_CALLS = 200
+# Rooms and players tracked individually; the least recently charged are dropped beyond this
+TOKEN_LEDGER_MAX_KEYS = int(os.getenv("TOKEN_LEDGER_MAX_KEYS", "10000"))
+
+_whitespace = re.compile(r"\s+")
+_control = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+
+_attribution: contextvars.ContextVar = contextvars.ContextVar("token_attribution", default={})
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def compact_text(text: str, budget: int = ARGUMENT_TOKEN_BUDGET) -> str:
+    """Collapse whitespace, drop control characters and trim to the token budget on a word boundary"""
+    text = _whitespace.sub(" ", _control.sub("", text)).strip()
+    if estimate_tokens(text) <= budget:
+        return text
+    cut = text[:budget * CHARS_PER_TOKEN]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut + " ..."
+
+
+@contextmanager
+def attribute(**labels):
+    """Attribute Gemini calls made in this context (and threads started from it) to a room/player"""
+    token = _attribution.set({**_attribution.get(), **labels})
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def _empty_totals() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+def _add(totals: dict, prompt_tokens: int, output_tokens: int):
+    totals["calls"] += 1
+    totals["prompt_tokens"] += prompt_tokens
+    totals["output_tokens"] += output_tokens
+    totals["total_tokens"] += prompt_tokens + output_tokens
+
+
+def _charge(by_key: OrderedDict, key: str, prompt_tokens: int, output_tokens: int, max_keys: int):
+    """Add to a key's totals in an LRU map, evicting the least recently charged key when full"""
+    totals = by_key.get(key)
+    if totals is None:
+        totals = by_key[key] = _empty_totals()
+        if len(by_key) > max_keys:
+            by_key.popitem(last=False)
+    else:
+        by_key.move_to_end(key)
+    _add(totals, prompt_tokens, output_tokens)
+
+
+class TokenLedger:
+    """
+    Running token spend per call kind, per room and per player. Per-room and
+    per-player totals are kept for the max_keys most recently active of each,
+    so a long-running worker's ledger doesn't grow with every room ever played.
+    """
+
+    def __init__(self, max_keys: int = TOKEN_LEDGER_MAX_KEYS):
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+        self.totals = _empty_totals()
+        self.by_kind: dict = {}
+        self.by_room: OrderedDict = OrderedDict()
+        self.by_player: OrderedDict = OrderedDict()
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+    def record(self, kind: str, prompt_tokens: int, output_tokens: int, estimated: bool = False):
+        labels = _attribution.get()
+        room_key = labels.get("room_key")
+        player = labels.get("player")
+        with self._lock:
+            _add(self.totals, prompt_tokens, output_tokens)
+            _add(self.by_kind.setdefault(kind, _empty_totals()), prompt_tokens, output_tokens)
+            if room_key:
+                _charge(self.by_room, room_key, prompt_tokens, output_tokens, self.max_keys)
+            if player:
+                _charge(self.by_player, player, prompt_tokens, output_tokens, self.max_keys)
+            self.recent.append({
+                "kind": kind,
+                "room_key": room_key,
+                "player": player,
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "estimated": estimated,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    def record_response(self, kind: str, prompt: str, output: str, usage: Optional[dict]):
+        """Record a call from Gemini's usageMetadata, falling back to estimates"""
+        if usage and "promptTokenCount" in usage:
+            self.record(kind, usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0))
+        else:
+            self.record(kind, estimate_tokens(prompt), estimate_tokens(output), estimated=True)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "totals": dict(self.totals),
+                "by_kind": {kind: dict(t) for kind, t in self.by_kind.items()},
+                "rooms": len(self.by_room),
+                "players": len(self.by_player),
+                "argument_token_budget": ARGUMENT_TOKEN_BUDGET,
+                "recent_calls": list(self.recent)[-20:]
+            }
+
+    def for_room(self, room_key: str) -> Optional[dict]:
+        with self._lock:
+            totals = self.by_room.get(room_key)
+            return dict(totals) if totals else None
+
+    def for_player(self, username: str) -> Optional[dict]:
+        with self._lock:
+            totals = self.by_player.get(username)
+            return dict(totals) if totals else None
+
+
+ledger = TokenLedger()
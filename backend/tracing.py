@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import asyncio
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional, List
+
+# Tracing configuration
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR", "tmp/traces")
+# Traces faster than this are dropped so that room polling doesn't flood the exporter
+TRACE_MIN_DURATION_MS = float(os.getenv("TRACE_MIN_DURATION_MS", "100"))
+
+# Profiling configuration
+PROFILE_DIR = os.getenv("PROFILE_DIR", "tmp/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """All spans recorded for one root operation (usually one HTTP request)"""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List["Span"] = []
+
+
+class Span:
+    def __init__(self, name: str, trace: Trace, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "thread": self.thread,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class JsonFileExporter:
+    """
+    Append finished traces as JSON lines to a daily file under TRACE_DIR.
+    Root spans usually finish on the event loop, so the file is written by a
+    writer thread of its own rather than by the caller.
+    """
+
+    def __init__(self, directory: str = TRACE_DIR, min_duration_ms: float = TRACE_MIN_DURATION_MS):
+        self.directory = directory
+        self.min_duration_ms = min_duration_ms
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def export(self, trace: Trace, root: Span):
+        if (root.duration_ms or 0.0) < self.min_duration_ms and root.error is None:
+            return
+        record = {
+            "trace_id": trace.trace_id,
+            "name": root.name,
+            "duration_ms": round(root.duration_ms or 0.0, 3),
+            "spans": [s.to_dict() for s in trace.spans]
+        }
+        if self._writer is None:
+            self._start_writer()
+        self._queue.put(record)
+
+    def flush(self):
+        """Wait until every exported trace has been written"""
+        self._queue.join()
+
+    def _start_writer(self):
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self._write(record)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, record: dict):
+        filename = os.path.join(self.directory, f"traces-{time.strftime('%Y%m%d')}.jsonl")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(filename, "a") as file:
+                file.write(json.dumps(record, default=str) + "\n")
+        except Exception as e:
+            print(f"[ERROR] Could not export trace {record['trace_id']}: {e}")
+
+
+exporter = JsonFileExporter()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a span around a block of code. The span becomes the parent of any
+    span opened in the same context, including threads started with
+    asyncio.to_thread, so nesting follows the call chain automatically.
+    Opening a span with no active parent starts (and later exports) a new trace.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    parent = _current_span.get()
+    trace = parent.trace if parent else Trace()
+    current = Span(name, trace, parent, attributes)
+    trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+        if parent is None:
+            exporter.export(trace, current)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span() for both sync and async functions"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    """
+    Periodically samples the stacks of every thread in the process and
+    aggregates them in collapsed-stack format ("frame;frame;frame count"),
+    which flamegraph.pl, speedscope and inferno all read directly.
+
+    Samples are not attributed to a request: the event loop thread and the
+    to_thread workers are shared, so a profile started for one request also
+    holds whatever else the process ran in that time window. Each stack is
+    rooted at its thread's name.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self._stop.wait(self.interval)
+
+    def dump(self, label: str) -> Optional[str]:
+        if not self.samples:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{label}.folded")
+        with open(path, "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+
+class ProfilingSwitch:
+    """
+    Runtime switch for profiling a random fraction of requests. A profile
+    covers the whole process for the duration of the sampled request (see
+    SamplingProfiler) and is named after that request's trace id.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.profiles_written = 0
+        # Only one profiler runs at a time; each one already samples every thread
+        self._active = threading.Lock()
+
+    def configure(self, enabled: bool, sample_rate: float):
+        self.enabled = enabled
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    def maybe_start(self) -> Optional[SamplingProfiler]:
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        return SamplingProfiler().start()
+
+    def finish(self, profiler: SamplingProfiler, label: Optional[str] = None) -> Optional[str]:
+        """Stop the profiler and write its profile; blocks, so call it off the event loop"""
+        try:
+            profiler.stop()
+            path = profiler.dump(label or uuid.uuid4().hex)
+            if path:
+                self.profiles_written += 1
+            return path
+        finally:
+            self._active.release()
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "profiles_written": self.profiles_written,
+            "profile_dir": PROFILE_DIR
+        }
+
+
+profiling = ProfilingSwitch()